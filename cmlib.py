@@ -0,0 +1,155 @@
+mem_classify = {
+  'load': 0x00000000,
+  'entry': 0x00000000,
+  'code': (
+    0xc8201884,
+    0x2d002700,
+    0x2701d003,
+    0xd00043ee,
+    0x42a0e004,
+    0xc840d004,
+    0xd0fa42ae,
+    0x46202702,
+    0x3301701f,
+    0xd1eb3901,
+    0xbe002000,
+  ),
+}
+mem_march = {
+  'load': 0x00000000,
+  'entry': 0x00000000,
+  'code': (
+    0x00892700,
+    0x46041809,
+    0x60252501,
+    0x42ae6826,
+    0x429fd004,
+    0x00bed201,
+    0x37015194,
+    0xd1f4006d,
+    0x25004604,
+    0x34046025,
+    0xd1fb428c,
+    0x68264604,
+    0xd00442ae,
+    0xd201429f,
+    0x519400be,
+    0x43ee3701,
+    0x34046026,
+    0xd1f2428c,
+    0x43ed4604,
+    0x42ae6826,
+    0x429fd004,
+    0x00bed201,
+    0x37015194,
+    0x602643ee,
+    0x428c3404,
+    0x460cd1f2,
+    0x3c0443ed,
+    0x42ae6826,
+    0x429fd004,
+    0x00bed201,
+    0x37015194,
+    0x602643ee,
+    0xd1f24284,
+    0x43ed460c,
+    0x68263c04,
+    0xd00442ae,
+    0xd201429f,
+    0x519400be,
+    0x43ee3701,
+    0x42846026,
+    0x4604d1f2,
+    0x682643ed,
+    0xd00442ae,
+    0xd201429f,
+    0x519400be,
+    0x34043701,
+    0xd1f4428c,
+    0xbe004638,
+  ),
+}
+mem_fill = {
+  'load': 0x00000000,
+  'entry': 0x00000000,
+  'code': (
+    0x460c460b,
+    0x0896460d,
+    0xc03ad002,
+    0xd1fc3e01,
+    0x40162603,
+    0xc002d002,
+    0xd1fc3e01,
+    0xbe002000,
+  ),
+}
+mem_copy = {
+  'load': 0x00000000,
+  'entry': 0x00000000,
+  'code': (
+    0xd80d4281,
+    0xd0030896,
+    0xc1b8c8b8,
+    0xd1fb3e01,
+    0x40162603,
+    0xc808d00d,
+    0x3e01c108,
+    0xe008d1fb,
+    0x19800096,
+    0x38041989,
+    0x68033904,
+    0x3a01600b,
+    0x2000d1f9,
+    0x0000be00,
+  ),
+}
+mem_crc32 = {
+  'load': 0x00000000,
+  'entry': 0x00000000,
+  'code': (
+    0x24004f13,
+    0x26084625,
+    0xd300086d,
+    0x3e01407d,
+    0x00a6d1fa,
+    0x3401519d,
+    0xd0f30a26,
+    0x02b62601,
+    0x46b018f6,
+    0x24001887,
+    0x780543e4,
+    0x40653001,
+    0x0dad062d,
+    0x0a24595d,
+    0x42b8406c,
+    0x43e4d1f5,
+    0xc5104645,
+    0x390146a8,
+    0x2000d1ec,
+    0x46c0be00,
+    0xedb88320,
+  ),
+}
+mem_unlz = {
+  'load': 0x00000000,
+  'entry': 0x00000000,
+  'code': (
+    0x1809b430,
+    0xd2194288,
+    0x30017803,
+    0xd2072b80,
+    0x78043301,
+    0x70143001,
+    0x3b013201,
+    0xe7f1d1f9,
+    0x78043b7d,
+    0x30027845,
+    0x432c022d,
+    0x78251b14,
+    0x70153401,
+    0x3b013201,
+    0xe7e3d1f9,
+    0xbc304610,
+    0x00004770,
+  ),
+}
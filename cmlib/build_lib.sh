@@ -0,0 +1,16 @@
+#!/bin/bash
+
+# These routines are position independent.
+# They are built for address 0 and relocated when they are loaded.
+
+ASM2PY=../tools/asm2py
+LIB=../cmlib.py
+
+rm $LIB
+
+$ASM2PY -l 0 mem_classify.S >> $LIB
+$ASM2PY -l 0 mem_march.S >> $LIB
+$ASM2PY -l 0 mem_fill.S >> $LIB
+$ASM2PY -l 0 mem_copy.S >> $LIB
+$ASM2PY -l 0 mem_crc32.S >> $LIB
+$ASM2PY -l 0 mem_unlz.S >> $LIB
@@ -310,6 +310,11 @@ class dbgio:
       n -= nread
       adr += nread * 4
 
+  def probe_rd32(self, adr, n):
+    """read n 32-bit words from memory: return False if the read faults, None if faults can't be detected"""
+    # the dap memory reads are not implemented, so a fault can't be seen: probing is unsupported
+    return None
+
   def rdmem16(self, adr, n, io):
     """read n 16-bit words from memory starting at adr"""
     max_n = 0x20
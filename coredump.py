@@ -0,0 +1,173 @@
+#-----------------------------------------------------------------------------
+"""
+
+Core Dump
+
+Write the target state to an ELF core file:
+ram regions and selected peripherals as PT_LOAD segments,
+core/fpu registers as notes in the Linux ARM format.
+
+"""
+#-----------------------------------------------------------------------------
+
+import struct
+import time
+
+import util
+import iobuf
+
+#-----------------------------------------------------------------------------
+
+help_coredump = (
+  ('<file> [name ...]', 'write an ELF core file'),
+  ('  file', 'name of core file'),
+  ('  name', 'extra memory region or peripheral - see "map" command'),
+)
+
+#-----------------------------------------------------------------------------
+
+ET_CORE = 4
+EM_ARM = 40
+PT_LOAD = 1
+PT_NOTE = 4
+PF_X = 1
+PF_W = 2
+PF_R = 4
+NT_PRSTATUS = 1
+NT_ARM_VFP = 0x400
+NT_PYCS_REGS = 1
+
+SIGTRAP = 5
+
+sizeof_ehdr = 52
+sizeof_phdr = 32
+
+# peripherals included by default (fault status registers)
+_default_peripherals = ('SCB',)
+
+#-----------------------------------------------------------------------------
+
+def elf_note(name, ntype, desc):
+  """return an ELF note"""
+  name = name.encode() + b'\0'
+  x = struct.pack('<LLL', len(name), len(desc), ntype)
+  return b''.join((x, name, bytes(-len(name) & 3), desc, bytes(-len(desc) & 3)))
+
+def prstatus_note(regs):
+  """return an NT_PRSTATUS note for the core registers"""
+  # elf_siginfo, cursig, sigpend, sighold, pid, ppid, pgrp, sid, 4 timevals
+  hdr = struct.pack('<3lhxxLL4l8l', 0, 0, 0, SIGTRAP, 0, 0, 1, 0, 0, 0, *((0,) * 8))
+  # r0..r15, cpsr, orig_r0
+  regs = struct.pack('<18L', *(regs + [regs[0],]))
+  fpvalid = struct.pack('<l', 1)
+  return elf_note('CORE', NT_PRSTATUS, hdr + regs + fpvalid)
+
+def vfp_note(sregs, fpscr):
+  """return an NT_ARM_VFP note for the fpu registers"""
+  # 32 double precision registers, fpscr
+  sregs = sregs + [0,] * (64 - len(sregs))
+  return elf_note('LINUX', NT_ARM_VFP, struct.pack('<64LL', *(sregs + [fpscr,])))
+
+#-----------------------------------------------------------------------------
+
+class coredump(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.device = cpu.device
+
+  def ram_regions(self):
+    """return the (name, adr, size) ram regions for the device"""
+    regions = []
+    for p in self.device.peripheral_list():
+      if p.registers is None and p.size and 'ram' in p.name.lower():
+        regions.append((p.name, p.address, p.size))
+    return regions
+
+  def peripheral_region(self, p):
+    """return the (name, adr, size) region for a named memory or peripheral"""
+    if p.registers is None:
+      return (p.name, p.address, p.size)
+    # only read up to the end of the last register
+    size = max([r.offset + (r.size >> 3) for r in p.registers.values()])
+    return (p.name, p.address, util.roundup(size, 32))
+
+  def read_regs(self):
+    """return the register notes"""
+    regs = [self.cpu.rdreg('r%d' % i) for i in range(16)] + [self.cpu.rdreg('psr'),]
+    regs = [(x, 0)[x is None] for x in regs]
+    notes = [prstatus_note(regs)]
+    # registers not in the prstatus note
+    s = []
+    for name in ('msp', 'psp', 'special'):
+      x = self.cpu.rdreg_dcrsr(name)
+      if x is not None:
+        s.append('%s=%08x\n' % (name, x))
+    if 'FPU' in self.device.peripherals:
+      sregs = [self.cpu.rdreg_dcrsr('s%d' % i) for i in range(32)]
+      fpscr = self.cpu.rdreg_dcrsr('fpscr')
+      if None not in sregs and fpscr is not None:
+        notes.append(vfp_note(sregs, fpscr))
+    notes.append(elf_note('PYCS', NT_PYCS_REGS, ''.join(s).encode()))
+    return b''.join(notes)
+
+  def cmd_coredump(self, ui, args):
+    """write an ELF core file"""
+    if util.wrong_argc(ui, args, range(1, 16)):
+      return
+    name = args[0]
+    regions = self.ram_regions()
+    names = list(_default_peripherals) + args[1:]
+    for x in names:
+      if x not in self.device.peripherals:
+        if x in _default_peripherals:
+          continue
+        ui.put('unknown region/peripheral %s\n' % x)
+        return
+      r = self.peripheral_region(self.device.peripherals[x])
+      if r[1:] not in [y[1:] for y in regions]:
+        regions.append(r)
+    try:
+      f = iobuf.block_file(name)
+    except (IOError, OSError) as e:
+      ui.put('%s\n' % e)
+      return
+    # halt the cpu for a consistent state
+    running = self.cpu.dbgio.is_running()
+    self.cpu.halt()
+    t_start = time.time()
+    notes = self.read_regs()
+    # ELF header, program headers, notes, segments
+    nph = len(regions) + 1
+    ofs = sizeof_ehdr + (nph * sizeof_phdr)
+    phdrs = [struct.pack('<8L', PT_NOTE, ofs, 0, 0, len(notes), 0, 0, 4)]
+    ofs += len(notes)
+    for (_, adr, size) in regions:
+      phdrs.append(struct.pack('<8L', PT_LOAD, ofs, adr, adr, size, size, PF_R | PF_W | PF_X, 4))
+      ofs += size
+    ehdr = struct.pack('<4sBBBB8xHHLLLLLHHHHHH', b'\x7fELF', 1, 1, 1, 0,
+      ET_CORE, EM_ARM, 1, 0, sizeof_ehdr, 0, 0, sizeof_ehdr, sizeof_phdr, nph, 0, 0, 0)
+    f.put(0, b''.join([ehdr,] + phdrs + [notes,]))
+    # read the memory segments, the file is written by another thread
+    chunk = 32 << 10
+    n = 0
+    for (region_name, adr, size) in regions:
+      ui.put('%s: 0x%08x %s\n' % (region_name, adr, util.memsize(size)))
+      data = iobuf.data_buffer(32)
+      for i in range(0, size, chunk):
+        k = min(chunk, size - i)
+        data.buf = []
+        data.wr_idx = 0
+        self.cpu.rdmem32(adr + i, k >> 2, data)
+        f.put(adr + i, data.to_bytes('le'))
+        n += k
+    err = f.close()
+    t = time.time() - t_start
+    if running:
+      self.cpu.go()
+    if err is not None:
+      ui.put('%s\n' % err)
+      return
+    ui.put('%d bytes written to %s (%.2f KiB/sec)\n' % (f.n, name, float(n)/(t * 1024.0)))
+
+#-----------------------------------------------------------------------------
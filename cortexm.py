@@ -10,6 +10,11 @@ import time
 
 import util
 import iobuf
+import dbgmem
+import memcache
+import libcache
+import memmap
+import symbols
 import cmregs
 import soc
 
@@ -51,6 +56,35 @@ regnames = (
   'faultmask','basepri','control',
 )
 
+# DCRSR register selectors for registers the debugger may not map
+dcrsr_regsel = {
+  'msp': 0x11,
+  'psp': 0x12,
+  # control[31:24], faultmask[23:16], basepri[15:8], primask[7:0]
+  'special': 0x14,
+  'fpscr': 0x21,
+}
+dcrsr_regsel.update(dict([('s%d' % i, 0x40 + i) for i in range(32)]))
+
+# registers that may be modified by a library routine
+_lib_regnames = (
+  'r0','r1','r2','r3','r4','r5','r6','r7',
+  'r8','r9','r10','r11','r12','pc','psr',
+)
+
+# -----------------------------------------------------------------------------
+
+def relocate_lib(lib, adr):
+  """return a copy of a position independent library routine loaded at adr"""
+  x = dict(lib)
+  x['load'] = adr
+  x['entry'] = adr + lib['entry'] - lib['load']
+  return x
+
+def sizeof_lib(lib):
+  """return the size in bytes of a library routine in ram (code and residency checksum word)"""
+  return (len(lib['code']) * 4) + 4
+
 # -----------------------------------------------------------------------------
 # System Exceptions
 
@@ -112,11 +146,20 @@ class cortexm(object):
     self.device = device
     self.saved_regs = []
     self.width = 32
+    # host copies of immutable memory
+    self.cache = memcache.memcache(self)
+    # library routines resident in ram
+    self.libs = libcache.libcache(self)
+    # readable memory map
+    self.memmap = memmap.memmap(self)
+    # address to symbol/line index
+    self.symbols = symbols.symbols()
     self.priority_bits = self.device.cpu_info.nvicPrioBits
 
     self.menu = (
       ('cpuid', self.cmd_cpuid),
       ('rate', self.cmd_systick_rate),
+      ('symbols', self.symbols.cmd_symbols, symbols.help_symbols),
       #('test', self.cmd_test),
     )
 
@@ -128,6 +171,9 @@ class cortexm(object):
   def rd(self, adr, n):
     """read from memory - n bits aligned"""
     adr = util.align(adr, n)
+    x = self.cache.rd(adr, n >> 3)
+    if x is not None:
+      return int.from_bytes(x, 'little')
     if n == 32:
       return self.dbgio.rd32(adr)
     elif n == 16:
@@ -136,17 +182,36 @@ class cortexm(object):
       return self.dbgio.rd8(adr)
     assert False
 
+  def rd_cache(self, adr, n, io, width):
+    """read n width-bit values from the memory cache: return True on a hit"""
+    x = self.cache.rd(adr, n * (width >> 3))
+    if x is None:
+      return False
+    buf = iobuf.data_buffer(width)
+    buf.from_bytes(x, 'le')
+    wr = getattr(io, 'wr%d' % width)
+    for val in buf.buf:
+      wr(val)
+    return True
+
   def rdmem(self, adr, n, io):
     """read a buffer from memory starting at adr"""
+    for width in (32, 16, 8):
+      if io.has_wr(width):
+        if self.rd_cache(adr, n, io, width):
+          return
+        break
     self.dbgio.rdmem(adr, n, io)
 
   def rdmem32(self, adr, n, io):
     """read n 32-bit words from memory starting at adr"""
-    self.dbgio.rdmem32(adr, n, io)
+    if not self.rd_cache(adr, n, io, 32):
+      self.dbgio.rdmem32(adr, n, io)
 
   def wr(self, adr, val, n):
     """write to memory - n bits aligned"""
     adr = util.align(adr, n)
+    self.libs.invalidate(adr, n >> 3)
     if n == 32:
       return self.dbgio.wr32(adr, val)
     elif n == 16:
@@ -157,12 +222,26 @@ class cortexm(object):
 
   def wrmem(self, adr, n, io):
     """write a buffer to memory starting at adr"""
+    self.libs.invalidate(adr, n * (io.width >> 3))
     self.dbgio.wrmem(adr, n, io)
 
   def wrmem32(self, adr, n, io):
     """write n 32-bit words to memory starting at adr"""
+    self.libs.invalidate(adr, n << 2)
     self.dbgio.wrmem32(adr, n, io)
 
+  def rdbytes(self, adr, n):
+    """read n bytes (any alignment) starting at adr, return a bytes object"""
+    x = self.cache.rd(adr, n)
+    if x is not None:
+      return x
+    return dbgmem.rdbytes(self.dbgio, adr, n)
+
+  def wrbytes(self, adr, data):
+    """write a bytes object (any alignment) to memory starting at adr"""
+    self.libs.invalidate(adr, len(data))
+    dbgmem.wrbytes(self.dbgio, adr, data)
+
   def wrreg(self, reg, val):
     """write to a cpu register"""
     # the cpu must be halted
@@ -172,6 +251,16 @@ class cortexm(object):
     """read from a cpu register"""
     return self.dbgio.rdreg(reg)
 
+  def rdreg_dcrsr(self, reg):
+    """read from a cpu register using the debug core register selector"""
+    # the cpu must be halted
+    self.wr(DCB_DCRSR, dcrsr_regsel[reg], 32)
+    t_end = time.time() + 0.1
+    while (self.rd(DCB_DHCSR, 32) & S_REGRDY) == 0:
+      if time.time() > t_end:
+        return None
+    return self.rd(DCB_DCRDR, 32)
+
   def halt(self, msg=False):
     """halt the cpu"""
     if self.dbgio.is_halted():
@@ -192,15 +281,20 @@ class cortexm(object):
 
   def reset(self):
     """reset the cpu"""
+    self.libs.reset()
     self.dbgio.reset()
 
   def step(self):
     """single step the cpu"""
     self.dbgio.step()
 
-  def runlib(self, lib):
+  def runlib(self, lib, args = None):
     """run a library routine that has been loaded to ram"""
     # the cpu must be halted
+    if args is not None:
+      # the arguments are passed in r0, r1, r2 ...
+      for (i, val) in enumerate(args):
+        self.wrreg('r%d' % i, val)
     self.wrreg('pc', lib['entry'])
     # run the library routine
     self.dbgio.go()
@@ -211,14 +305,35 @@ class cortexm(object):
     return self.rdreg('r0')
 
   def loadlib(self, lib, run = False):
-    """load a library routine to ram"""
+    """load a library routine to ram (if it is not already resident)"""
     # the cpu must be halted
-    code = iobuf.data_buffer(32, lib['code'])
-    self.wrmem(lib['load'], len(code), code)
+    self.libs.load(lib)
     if run:
       return self.runlib(lib)
     return 0
 
+  def save_context(self, ram = None):
+    """save the cpu state (and an optional ram region) before running library code"""
+    running = self.dbgio.is_running()
+    self.halt()
+    regs = [(name, self.rdreg(name)) for name in _lib_regnames]
+    data = None
+    if ram is not None:
+      data = iobuf.data_buffer(32)
+      self.rdmem32(ram.adr, ram.size >> 2, data)
+    return (running, regs, ram, data)
+
+  def restore_context(self, ctx):
+    """restore the cpu state saved with save_context()"""
+    (running, regs, ram, data) = ctx
+    if ram is not None:
+      self.wrmem32(ram.adr, len(data), data)
+    for (name, val) in regs:
+      if val is not None:
+        self.wrreg(name, val)
+    if running:
+      self.go()
+
   def NVIC_GetPriority(self, irq):
     """return the priority encoding for an exception"""
     if irq == Reset_IRQn:
@@ -272,7 +387,10 @@ class cortexm(object):
       if regs[i] is None:
         # we don't know this register value
         continue
-      cols.append([regnames[i], ': %08x' % regs[i], delta[i]])
+      where = ''
+      if regnames[i] in ('pc', 'lr'):
+        where = self.symbols.annotate(regs[i] & ~1)
+      cols.append([regnames[i], ': %08x' % regs[i], delta[i], where])
     ui.put('%s\n' % util.display_cols(cols))
 
   def cmd_disassemble(self, ui, args):
@@ -295,7 +413,7 @@ class cortexm(object):
     # align the address to 32 bits
     adr = util.align(adr, 32)
     # disassemble
-    md = iobuf.arm_disassemble(ui, adr)
+    md = iobuf.arm_disassemble(ui, adr, self.symbols)
     self.rdmem32(adr, n, md)
 
   def cmd_go(self, ui, args):
@@ -440,7 +558,8 @@ class cortexm(object):
       else:
         prio = '%d.%d' % self.NVIC_DecodePriority(priority, group)
       # vector
-      vector = '%08x' % (self.rd(vtable + (n * 4), 32) & ~1)
+      vector = self.rd(vtable + (n * 4), 32) & ~1
+      vector = ('%08x %s' % (vector, self.symbols.annotate(vector))).rstrip()
       clist.append([name, exc_n, irq_n, epa, prio, vector, i.description])
     ui.put('%s\n' % util.display_cols(clist, [0,0,0,0,0,0,0]))
 
@@ -0,0 +1,124 @@
+#-----------------------------------------------------------------------------
+"""
+
+C Structure Reader
+
+Describe the layout of a C structure and read it (or an array of them)
+from target memory with a single burst read. The fields of the resulting
+record are attributes, so they can be used like the C structure.
+
+A layout is a tuple of fields: (name, offset, type) or (name, offset, type, count).
+type is a scalar type name (u8, i8, u16, i16, u32, i32, u64, i64, f32, f64, char)
+optionally prefixed with '<' or '>' for the endianness, or a nested layout.
+A count makes the field an array. A char array is returned as a string.
+
+"""
+#-----------------------------------------------------------------------------
+
+import struct
+
+#-----------------------------------------------------------------------------
+
+_scalar_types = {
+  'u8': 'B',
+  'i8': 'b',
+  'u16': 'H',
+  'i16': 'h',
+  'u32': 'L',
+  'i32': 'l',
+  'u64': 'Q',
+  'i64': 'q',
+  'f32': 'f',
+  'f64': 'd',
+  'char': 's',
+}
+
+#-----------------------------------------------------------------------------
+
+class record(object):
+  """a structure read from memory"""
+
+  def __init__(self, layout, adr):
+    self._layout = layout
+    self._adr = adr
+
+  def field_adr(self, name):
+    """return the address of a field"""
+    return self._adr + self._layout.offsets[name]
+
+  def __str__(self):
+    s = ['%s @ 0x%08x' % (self._layout.name, self._adr)]
+    for (name, _, _, _) in self._layout.fields:
+      s.append('  %s = %s' % (name, getattr(self, name)))
+    return '\n'.join(s)
+
+#-----------------------------------------------------------------------------
+
+class layout(object):
+  """structure layout"""
+
+  def __init__(self, name, fields, size=None, endian='<'):
+    self.name = name
+    self.fields = []
+    self.offsets = {}
+    end = 0
+    for f in fields:
+      (fname, ofs, ftype) = f[:3]
+      count = None
+      if len(f) == 4:
+        count = f[3]
+      if isinstance(ftype, layout):
+        fsize = ftype.size
+        fmt = None
+      else:
+        e = endian
+        if ftype[0] in '<>':
+          e = ftype[0]
+          ftype = ftype[1:]
+        assert ftype in _scalar_types, 'unknown type %s for field %s' % (ftype, fname)
+        if ftype == 'char':
+          # a char array is unpacked as a single bytes object
+          fmt = struct.Struct('%s%ds' % (e, count or 1))
+          fsize = fmt.size
+          count = None
+        else:
+          fmt = struct.Struct(e + _scalar_types[ftype])
+          fsize = fmt.size
+      self.fields.append((fname, ofs, (ftype, fmt)[fmt is not None], count))
+      self.offsets[fname] = ofs
+      end = max(end, ofs + (fsize * (count or 1)))
+    self.size = end if size is None else size
+    assert self.size >= end, '%s: size is smaller than the fields' % name
+
+  def unpack_field(self, data, ofs, ftype, adr):
+    """unpack a field value"""
+    if isinstance(ftype, layout):
+      return ftype.unpack(data, ofs, adr)
+    x = ftype.unpack_from(data, ofs)[0]
+    if isinstance(x, bytes):
+      # C string
+      return x.split(b'\0', 1)[0].decode('latin-1')
+    return x
+
+  def unpack(self, data, ofs=0, adr=0):
+    """unpack a record from a bytes object"""
+    r = record(self, adr)
+    for (name, fofs, ftype, count) in self.fields:
+      if count is None:
+        x = self.unpack_field(data, ofs + fofs, ftype, adr + fofs)
+      else:
+        k = ftype.size
+        x = [self.unpack_field(data, ofs + fofs + (i * k), ftype, adr + fofs + (i * k)) for i in range(count)]
+      setattr(r, name, x)
+    return r
+
+  def rd(self, cpu, adr):
+    """read a structure from memory"""
+    return self.unpack(cpu.rdbytes(adr, self.size), 0, adr)
+
+  def rd_array(self, cpu, adr, n):
+    """read an array of n structures from memory"""
+    data = cpu.rdbytes(adr, self.size * n)
+    return [self.unpack(data, i * self.size, adr + (i * self.size)) for i in range(n)]
+
+#-----------------------------------------------------------------------------
@@ -0,0 +1,63 @@
+#-----------------------------------------------------------------------------
+"""
+
+Debugger Memory Access Planning
+
+Split an arbitrary byte range into an unaligned head, a 32-bit aligned body
+and an unaligned tail. The body is transferred with 32-bit accesses, which
+each debugger backend breaks into the largest transactions the probe allows.
+Only the head and tail (at most 3 bytes each) use 8-bit accesses.
+
+"""
+#-----------------------------------------------------------------------------
+
+import iobuf
+
+#-----------------------------------------------------------------------------
+
+def plan(adr, n):
+  """return a list of (width, adr, count) accesses covering n bytes at adr"""
+  accesses = []
+  # unaligned head
+  k = min(-adr & 3, n)
+  if k:
+    accesses.append((8, adr, k))
+    adr += k
+    n -= k
+  # aligned body
+  k = n >> 2
+  if k:
+    accesses.append((32, adr, k))
+    adr += k * 4
+    n -= k * 4
+  # unaligned tail
+  if n:
+    accesses.append((8, adr, n))
+  return accesses
+
+def rdbytes(dbgio, adr, n):
+  """read n bytes starting at adr, return a bytes object"""
+  data = []
+  for (width, a, k) in plan(adr, n):
+    io = iobuf.data_buffer(width)
+    if width == 32:
+      dbgio.rdmem32(a, k, io)
+    else:
+      dbgio.rdmem8(a, k, io)
+    data.append(io.to_bytes('le'))
+  return b''.join(data)
+
+def wrbytes(dbgio, adr, data):
+  """write a bytes object to memory starting at adr"""
+  ofs = 0
+  for (width, a, k) in plan(adr, len(data)):
+    io = iobuf.data_buffer(width)
+    nbytes = k * (width >> 3)
+    io.from_bytes(data[ofs:ofs + nbytes], 'le')
+    if width == 32:
+      dbgio.wrmem32(a, k, io)
+    else:
+      dbgio.wrmem8(a, k, io)
+    ofs += nbytes
+
+#-----------------------------------------------------------------------------
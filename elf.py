@@ -0,0 +1,114 @@
+#-----------------------------------------------------------------------------
+"""
+
+ELF File Reader
+
+Read the loadable segments and sections of a 32-bit little endian ELF file.
+
+"""
+#-----------------------------------------------------------------------------
+
+import struct
+
+#-----------------------------------------------------------------------------
+
+PT_LOAD = 1
+SHT_NOBITS = 8
+
+_ehdr_fmt = '<16sHHLLLLLHHHHHH'
+_phdr_fmt = '<8L'
+_shdr_fmt = '<10L'
+
+#-----------------------------------------------------------------------------
+
+class Error(Exception):
+  pass
+
+def is_elf(name):
+  """return True if the file is an ELF file"""
+  with open(name, 'rb') as f:
+    return f.read(4) == b'\x7fELF'
+
+#-----------------------------------------------------------------------------
+
+class segment(object):
+  """program segment"""
+
+  def __init__(self, x):
+    (self.type, self.offset, self.vaddr, self.paddr, self.filesz, self.memsz, self.flags, self.align) = x
+    self.data = None
+
+class section(object):
+  """section"""
+
+  def __init__(self, x):
+    (self.name_ofs, self.type, self.flags, self.addr, self.offset, self.size, self.link, self.info, self.addralign, self.entsize) = x
+    self.name = None
+    self.data = None
+
+#-----------------------------------------------------------------------------
+
+class elf(object):
+
+  def __init__(self, name):
+    with open(name, 'rb') as f:
+      self.data = f.read()
+    if len(self.data) < struct.calcsize(_ehdr_fmt):
+      raise Error('%s: too small for an ELF file' % name)
+    x = struct.unpack_from(_ehdr_fmt, self.data)
+    ident = x[0]
+    if ident[:4] != b'\x7fELF':
+      raise Error('%s: not an ELF file' % name)
+    if ident[4] != 1 or ident[5] != 1:
+      raise Error('%s: not a 32-bit little endian ELF file' % name)
+    (self.type, self.machine, _, self.entry, self.phoff, self.shoff, self.flags) = x[1:8]
+    (_, self.phentsize, self.phnum, self.shentsize, self.shnum, self.shstrndx) = x[8:]
+    # program headers
+    self.segments = []
+    if self.phnum:
+      self.check_table(name, 'program header', self.phoff, self.phnum, self.phentsize, _phdr_fmt)
+    for i in range(self.phnum):
+      s = segment(struct.unpack_from(_phdr_fmt, self.data, self.phoff + (i * self.phentsize)))
+      self.check_range(name, 'segment %d' % i, s.offset, s.filesz)
+      s.data = self.data[s.offset:s.offset + s.filesz]
+      self.segments.append(s)
+    # section headers
+    self.sections = []
+    if self.shoff:
+      self.check_table(name, 'section header', self.shoff, self.shnum, self.shentsize, _shdr_fmt)
+      for i in range(self.shnum):
+        s = section(struct.unpack_from(_shdr_fmt, self.data, self.shoff + (i * self.shentsize)))
+        if s.type != SHT_NOBITS:
+          self.check_range(name, 'section %d' % i, s.offset, s.size)
+          s.data = self.data[s.offset:s.offset + s.size]
+        self.sections.append(s)
+      if self.shstrndx < self.shnum:
+        names = self.sections[self.shstrndx].data
+        if names is None:
+          raise Error('%s: bad section name table' % name)
+        for s in self.sections:
+          s.name = names[s.name_ofs:names.find(b'\0', s.name_ofs)].decode('latin-1')
+
+  def check_range(self, name, what, ofs, n):
+    """raise an error if ofs..ofs+n-1 is not within the file"""
+    if ofs + n > len(self.data):
+      raise Error('%s: %s is beyond the end of the file' % (name, what))
+
+  def check_table(self, name, what, ofs, num, entsize, fmt):
+    """raise an error if a header table is not within the file"""
+    if entsize < struct.calcsize(fmt):
+      raise Error('%s: bad %s size' % (name, what))
+    self.check_range(name, '%s table' % what, ofs, (num - 1) * entsize + struct.calcsize(fmt))
+
+  def section(self, name):
+    """return the named section - or None"""
+    for s in self.sections:
+      if s.name == name:
+        return s
+    return None
+
+  def load_segments(self):
+    """return the (load address, data) for the non-empty loadable segments"""
+    return [(s.paddr, s.data) for s in self.segments if s.type == PT_LOAD and s.filesz]
+
+#-----------------------------------------------------------------------------
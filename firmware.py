@@ -0,0 +1,187 @@
+#-----------------------------------------------------------------------------
+"""
+
+Firmware File Reader
+
+Read the data records of ELF (PT_LOAD segments), Intel HEX and Motorola
+S-record files and merge them into a sparse list of segments. Text files
+are read a line at a time and each record is merged into a sorted segment
+list as it is read, so the memory used is about the size of the populated
+address ranges.
+
+Segments can be aligned to the write granularity of a flash driver.
+Alignment padding is 0xff (erased flash) and never overwrites file data.
+Any other file is a raw binary and is not handled here.
+
+"""
+#-----------------------------------------------------------------------------
+
+import bisect
+
+import elf
+
+#-----------------------------------------------------------------------------
+
+class Error(Exception):
+  pass
+
+#-----------------------------------------------------------------------------
+
+def file_type(name):
+  """return the firmware file type: 'elf', 'ihex', 'srec' or None (raw binary)"""
+  with open(name, 'rb') as f:
+    x = f.read(64)
+  if x[:4] == b'\x7fELF':
+    return 'elf'
+  # the first line must be a hex text record
+  line = x.split(b'\n', 1)[0].strip()
+  if len(line) < 4 or line[1:].translate(None, b'0123456789abcdefABCDEF'):
+    return None
+  if line[:1] == b':':
+    return 'ihex'
+  if line[:1] == b'S' and line[1:2] in b'0123456789':
+    return 'srec'
+  return None
+
+#-----------------------------------------------------------------------------
+
+def hex_bytes(name, n, line):
+  """return the bytes of a hex text record"""
+  try:
+    return bytes.fromhex(line)
+  except ValueError:
+    raise Error('%s:%d: bad hex characters' % (name, n))
+
+def ihex_records(name):
+  """generate the (address, data) records of an Intel HEX file"""
+  base = 0
+  with open(name, 'r') as f:
+    for (n, line) in enumerate(f, 1):
+      line = line.strip()
+      if not line:
+        continue
+      if line[0] != ':':
+        raise Error('%s:%d: not an Intel HEX record' % (name, n))
+      x = hex_bytes(name, n, line[1:])
+      if len(x) < 5 or len(x) != x[0] + 5:
+        raise Error('%s:%d: bad record length' % (name, n))
+      if sum(x) & 0xff:
+        raise Error('%s:%d: bad checksum' % (name, n))
+      rtype = x[3]
+      data = x[4:-1]
+      if rtype == 0:
+        # data
+        yield (base + ((x[1] << 8) | x[2]), data)
+      elif rtype == 1:
+        # end of file
+        return
+      elif rtype in (2, 4) and len(data) != 2:
+        raise Error('%s:%d: bad address record' % (name, n))
+      elif rtype == 2:
+        # extended segment address
+        base = ((data[0] << 8) | data[1]) << 4
+      elif rtype == 4:
+        # extended linear address
+        base = ((data[0] << 8) | data[1]) << 16
+      # 3, 5: start address (ignored)
+
+# address bytes for the S-record data types
+_srec_adr = {'1': 2, '2': 3, '3': 4}
+
+def srec_records(name):
+  """generate the (address, data) records of a Motorola S-record file"""
+  with open(name, 'r') as f:
+    for (n, line) in enumerate(f, 1):
+      line = line.strip()
+      if not line:
+        continue
+      if len(line) < 4 or line[0] != 'S':
+        raise Error('%s:%d: not an S-record' % (name, n))
+      x = hex_bytes(name, n, line[2:])
+      if len(x) != x[0] + 1:
+        raise Error('%s:%d: bad record length' % (name, n))
+      if (sum(x) & 0xff) != 0xff:
+        raise Error('%s:%d: bad checksum' % (name, n))
+      k = _srec_adr.get(line[1])
+      if k is not None:
+        yield (int.from_bytes(x[1:1 + k], 'big'), x[1 + k:-1])
+      elif line[1] in '789':
+        # termination
+        return
+      # 0: header, 5/6: record count (ignored)
+
+def elf_records(name):
+  """generate the (address, data) records of an ELF file"""
+  try:
+    x = elf.elf(name)
+  except elf.Error as e:
+    raise Error(str(e))
+  for r in x.load_segments():
+    yield r
+
+_records = {
+  'elf': elf_records,
+  'ihex': ihex_records,
+  'srec': srec_records,
+}
+
+#-----------------------------------------------------------------------------
+
+def merge(records, align = 1):
+  """merge (address, data) records into sorted, non-overlapping segments aligned to align bytes"""
+  # sorted, non-touching [address, bytearray] segments and their start addresses
+  segs = []
+  starts = []
+  for (adr, data) in records:
+    if not data:
+      continue
+    if segs and starts[-1] + len(segs[-1][1]) == adr:
+      # the usual case: the record follows on from the last segment
+      segs[-1][1].extend(data)
+      continue
+    end = adr + len(data)
+    # the segments touching or overlapping the record
+    i = bisect.bisect_right(starts, adr)
+    if i > 0 and starts[i - 1] + len(segs[i - 1][1]) >= adr:
+      i -= 1
+    j = i
+    while j < len(segs) and segs[j][0] <= end:
+      j += 1
+    if i == j:
+      segs.insert(i, [adr, bytearray(data)])
+      starts.insert(i, adr)
+      continue
+    # extend the first segment (or a new one) in place, later records take precedence
+    (start, buf) = segs[i] if segs[i][0] <= adr else (adr, bytearray())
+    for (a, d) in segs[i:j]:
+      if d is not buf:
+        buf.extend(b'\xff' * (a - start - len(buf)))
+        buf.extend(d)
+    buf.extend(b'\xff' * (end - start - len(buf)))
+    buf[adr - start:end - start] = data
+    segs[i:j] = [[start, buf]]
+    starts[i:j] = [start]
+  # pad to the alignment and join the segments with touching aligned extents
+  out = []
+  segs.reverse()
+  while segs:
+    (start, buf) = segs.pop()
+    ofs = start & (align - 1)
+    buf[0:0] = b'\xff' * ofs
+    start -= ofs
+    while segs and segs[-1][0] & ~(align - 1) <= -(-(start + len(buf)) // align) * align:
+      (a, d) = segs.pop()
+      buf.extend(b'\xff' * (a - start - len(buf)))
+      buf.extend(d)
+    buf.extend(b'\xff' * (-len(buf) % align))
+    out.append((start, bytes(buf)))
+  return out
+
+def segments(name, align = 1):
+  """return the merged segments of a firmware file (None for a raw binary)"""
+  ftype = file_type(name)
+  if ftype is None:
+    return None
+  return merge(_records[ftype](name), align)
+
+#-----------------------------------------------------------------------------
@@ -8,9 +8,14 @@ Those drivers expose a common API used by this code.
 """
 #-----------------------------------------------------------------------------
 
+import time
+import zlib
+
 import util
 import mem
 import iobuf
+import lz
+import firmware
 
 #-----------------------------------------------------------------------------
 
@@ -23,18 +28,43 @@ _help_erase = (
 )
 
 _help_write = (
-  ('<filename> <address/name> [len]', 'write a file to flash'),
+  ('<filename> <address/name> [len] [--lz]', 'write a file to flash'),
+  ('<filename> [--lz]', 'write an ELF, Intel HEX or S-record file to flash'),
   ('  filename', 'name of file'),
   ('  address', 'address of memory (hex)'),
   ('  name', 'name of memory region - see "map" command'),
   ('  len', 'length of memory region (hex) - defaults to file size'),
+  ('  --lz', 'upload compressed data and expand it on the target'),
+)
+
+_help_boost = (
+  ('', 'display the clock boost state'),
+  ('on', 'run flash operations with a boosted cpu clock'),
+  ('off', 'run flash operations with the current cpu clock'),
+)
+
+_help_cache = (
+  ('', 'display the cached flash images'),
+  ('<filename> [address/name]', 'register a file as the expected flash content'),
+  ('  filename', 'name of binary, ELF, Intel HEX or S-record file'),
+  ('  address', 'address of memory (hex) for a binary file'),
+  ('  name', 'name of memory region - defaults to the firmware region'),
+  ('clear', 'remove all cached flash images'),
 )
 
 help_program = (
-  ('<filename>', 'write a firmware file to flash'),
-    ('  filename', 'name of file'),
+  ('<filename> [--delta] [--readback] [--lz]', 'write a firmware file to flash'),
+  ('  filename', 'name of binary, ELF, Intel HEX or S-record file'),
+  ('  --delta', 'only erase and write the sectors that have changed'),
+  ('  --lz', 'upload compressed data and expand it on the target'),
+  ('  --readback', 'verify by reading back the flash (default: on-target sector crc32)'),
 )
 
+# debugger time per erase operation (secs)
+_erase_overhead = 0.01
+# erase time (secs): (per operation, per byte) if the driver has no table
+_erase_time = (1.0, 0)
+
 #-----------------------------------------------------------------------------
 
 class flash(object):
@@ -43,19 +73,95 @@ class flash(object):
     self.driver = driver
     self.device = device
     self.mem = mem
+    self.cache = mem.cpu.cache
     self.menu = (
+      ('boost', self.cmd_boost, _help_boost),
+      ('cache', self.cmd_cache, _help_cache),
       ('erase', self.cmd_erase, _help_erase),
       ('info', self.cmd_info),
       ('write', self.cmd_write, _help_write),
     )
 
+  def erase_cost(self, op, sectors):
+    """return the estimated time (secs) of an erase operation over the sectors"""
+    (t, tb) = getattr(self.driver, 'ERASE_TIME', {}).get(op, _erase_time)
+    return _erase_overhead + t + tb * sum([x.size for x in sectors])
+
+  def erase_plan(self, sectors):
+    """return the cheapest (op, arg, sectors) erase operations for the sectors, and the blank sectors skipped"""
+    name = self.driver.firmware_region()
+    main = [x for x in self.driver.sector_list() if x.name == name]
+    req = set([x.adr for x in sectors])
+    # check for blank sectors on the target
+    blank = self.cache.rd_blank([(x.adr, x.size) for x in main])
+    if blank is None:
+      # unknown: assume all sectors have data
+      blank = [False] * len(main)
+    blank = dict([(x.adr, b) for (x, b) in zip(main, blank)])
+    need = [x for x in sectors if not blank.get(x.adr, False)]
+    keep = set([x.adr for x in main if x.adr not in req and not blank[x.adr]])
+    skipped = [x for x in sectors if blank.get(x.adr, False)]
+    # sector erases
+    plan = [('sector', x, [x]) for x in need]
+    # replace the sector erases within a bank with a bank erase when cheaper
+    banks = self.driver.bank_list() if hasattr(self.driver, 'bank_list') else {}
+    for (bank, bs) in sorted(banks.items()):
+      adrs = set([x.adr for x in bs])
+      if adrs & keep:
+        continue
+      ops = [x for x in plan if x[0] == 'sector' and x[1].adr in adrs]
+      if ops and self.erase_cost('bank', bs) < sum([self.erase_cost('sector', x[2]) for x in ops]):
+        plan = [x for x in plan if x not in ops] + [('bank', bank, bs)]
+    # replace everything with a mass erase when cheaper
+    if plan and not keep:
+      if self.erase_cost('mass', main) < sum([self.erase_cost(op, xs) for (op, _, xs) in plan]):
+        plan = [('mass', None, main)]
+    return (plan, skipped)
+
+  def erase_sectors(self, ui, sectors):
+    """erase sectors with the cheapest mass, bank and sector erases, skipping blank sectors"""
+    t_start = time.time()
+    (plan, skipped) = self.erase_plan(sectors)
+    ops = ['bank %d erase' % arg for (op, arg, _) in plan if op == 'bank']
+    if plan[:1] and plan[0][0] == 'mass':
+      ops.append('mass erase')
+    n = len([op for (op, _, _) in plan if op == 'sector'])
+    if n:
+      ops.append('%d sector erases' % n)
+    ui.put('erase plan: %d sectors, %d blank: %s\n' % (len(sectors), len(skipped), (', '.join(ops), 'nothing to erase')[not ops]))
+    if not plan:
+      return 0
+    ui.put('erasing : ')
+    progress = util.progress(ui, 1, len(plan))
+    n_errors = 0
+    # keep the flash unlocked for the batch
+    hold = hasattr(self.driver, 'hold')
+    try:
+      if hold:
+        self.driver.hold(True)
+      for (i, (op, arg, xs)) in enumerate(plan):
+        for x in xs:
+          self.cache.invalidate(x.adr, x.size)
+        if op == 'mass':
+          n_errors += self.driver.erase_all()
+        elif op == 'bank':
+          n_errors += self.driver.erase_bank(arg)
+        else:
+          n_errors += self.driver.erase(arg)
+        progress.update(i + 1)
+    finally:
+      if hold:
+        self.driver.hold(False)
+    progress.erase()
+    ui.put('done (%d errors, %.2f secs)\n' % (n_errors, time.time() - t_start))
+    return n_errors
+
   def cmd_erase(self, ui, args):
     """erase flash"""
     # check for erase all
     if len(args) == 1 and args[0] == '*':
-      ui.put('erase all: ')
-      n_errors = self.driver.erase_all()
-      ui.put('done (%d errors)\n' % n_errors)
+      name = self.driver.firmware_region()
+      self.erase_sectors(ui, [x for x in self.driver.sector_list() if x.name == name])
       return
     # memory region erase
     x = util.mem_args(ui, args, self.device)
@@ -71,20 +177,55 @@ class flash(object):
     if len(erase_list) == 0:
       ui.put('nothing to erase\n')
       return
-    # do the erase
-    ui.put('erasing : ')
-    progress = util.progress(ui, 1, len(erase_list))
-    n_erased = 0
-    n_errors = 0
-    for x in erase_list:
-      n_errors += self.driver.erase(x)
-      n_erased += 1
-      progress.update(n_erased)
-    progress.erase()
-    ui.put('done (%d errors)\n' % n_errors)
+    self.erase_sectors(ui, erase_list)
+
+  def cmd_boost(self, ui, args):
+    """boost the cpu clock during flash operations"""
+    if util.wrong_argc(ui, args, (0, 1)):
+      return
+    if not hasattr(self.driver, 'boost'):
+      ui.put('clock boost is not supported by this flash driver\n')
+      return
+    if len(args) == 1:
+      if args[0] not in ('on', 'off'):
+        ui.put(util.inv_arg)
+        return
+      self.driver.boost.enabled = args[0] == 'on'
+    ui.put('%s\n' % self.driver.boost)
+
+  def lz_start(self, ui):
+    """start compressed writes: return False if not supported"""
+    if not hasattr(self.driver, 'compress'):
+      ui.put('compressed writes are not supported by this flash driver\n')
+      return False
+    self.driver.compress = lz.stats()
+    return True
+
+  def lz_stop(self, ui):
+    """stop compressed writes and display the statistics"""
+    ui.put('%s\n' % self.driver.compress)
+    self.driver.compress = None
 
   def cmd_write(self, ui,args):
     """write to flash"""
+    compress = '--lz' in args
+    args = [x for x in args if x != '--lz']
+    if len(args) == 1:
+      # the file has the addresses
+      if util.file_arg(ui, args[0]) is None:
+        return
+      if firmware.file_type(args[0]) is None:
+        ui.put('%s is a binary file: specify an address\n' % args[0])
+        return
+      segs = self.file_segments(ui, args[0])
+      if segs is None:
+        return
+      if compress and not self.lz_start(ui):
+        return
+      self.write_segments(ui, segs)
+      if compress:
+        self.lz_stop(ui)
+      return
     x = util.file_mem_args(ui, args, self.device)
     if x is None:
       return
@@ -110,28 +251,276 @@ class flash(object):
     if msg is not None:
       ui.put('%s\n' % msg)
       return
+    if compress and not self.lz_start(ui):
+      return
     # read from file, write to memory
+    self.cache.invalidate(mr.adr, mr.size)
     mf = iobuf.read_file(ui, 'writing %s (%d bytes):' % (name, n), name, n)
     self.driver.write(mr, mf)
     mf.close(rate = True)
+    if compress:
+      self.lz_stop(ui)
+
+  def cmd_cache(self, ui, args):
+    """manage the flash read cache"""
+    if util.wrong_argc(ui, args, (0, 1, 2)):
+      return
+    if len(args) == 0:
+      ui.put('%s\n' % self.cache)
+      return
+    if args[0] == 'clear':
+      self.cache.clear()
+      return
+    name = args[0]
+    if util.file_arg(ui, name) is None:
+      return
+    if firmware.file_type(name) is not None:
+      try:
+        segments = firmware.segments(name)
+      except firmware.Error as e:
+        ui.put('%s\n' % e)
+        return
+    else:
+      x = util.mem_args(ui, (args[1:] or (self.driver.firmware_region(),)), self.device)
+      if x is None:
+        return
+      with open(name, 'rb') as f:
+        segments = [(x[0], f.read())]
+    # the images must be within the flash
+    sectors = sorted(self.driver.sector_list(), key = lambda x: x.adr)
+    for (adr, data) in segments:
+      (a, end) = (adr, adr + len(data) - 1)
+      for x in sectors:
+        if x.adr <= a <= x.end:
+          a = x.end + 1
+      if a <= end:
+        ui.put('%s: 0x%08x-0x%08x is not in flash\n' % (name, adr, end))
+        return
+    for (adr, data) in segments:
+      x = self.cache.add(name, adr, data)
+      if not self.cache.validate(x):
+        ui.put('%s: 0x%08x-0x%08x does not match the target\n' % (name, x.adr, x.end))
+        self.cache.images.remove(x)
+    ui.put('%s\n' % self.cache)
 
   def cmd_info(self, ui,args):
     """display flash information"""
     ui.put('%s\n' % self.driver)
+    if hasattr(self.driver, 'poll'):
+      # observed operation times
+      ui.put('\n%s\n' % self.driver.poll)
+    if hasattr(self.driver, 'throughput'):
+      # programming throughput per write mode
+      ui.put('\n%s\n' % self.driver.throughput)
+
+  def write_align(self):
+    """return the alignment (bytes) that meets the flash write requirements"""
+    adr = min([x.adr for x in self.driver.sector_list()])
+    for k in (4, 8, 16, 32, 64, 128, 256):
+      if self.driver.check_region(mem.region(None, adr + k, k)) is None:
+        return k
+    return 4
+
+  def file_segments(self, ui, name):
+    """return the (adr, data) segments to be written for a firmware file - or None"""
+    try:
+      segs = firmware.segments(name, self.write_align())
+    except (IOError, OSError, firmware.Error) as e:
+      ui.put('%s\n' % e)
+      return None
+    if segs is None:
+      # raw binary: at the start of the firmware region, 0xff padded as per the io objects
+      adr = util.mem_args(ui, (self.driver.firmware_region(),), self.device)[0]
+      with open(name, 'rb') as f:
+        data = f.read()
+      data += b'\xff' * (util.roundup(len(data), 32) - len(data))
+      return [(adr, data)]
+    if not segs:
+      ui.put('%s: no data\n' % name)
+      return None
+    for (adr, data) in segs:
+      msg = self.driver.check_region(mem.region(None, adr, len(data)))
+      if msg is not None:
+        ui.put('%s: 0x%08x-0x%08x: %s\n' % (name, adr, adr + len(data) - 1, msg))
+        return None
+    return segs
+
+  def file_ranges(self, adr, n):
+    """return the (adr, n) ranges of the sectors overlapping adr..adr+n-1"""
+    r = mem.region(None, adr, n)
+    ranges = []
+    for x in sorted(self.driver.sector_list(), key = lambda x: x.adr):
+      if x.overlap(r):
+        a = max(x.adr, r.adr)
+        ranges.append((a, min(x.end, r.end) + 1 - a))
+    return ranges
+
+  def segment_sectors(self, segs):
+    """return the sectors overlapping the segments"""
+    regions = [mem.region(None, adr, len(data)) for (adr, data) in segs]
+    return [x for x in sorted(self.driver.sector_list(), key = lambda x: x.adr) if any([x.overlap(r) for r in regions])]
+
+  def write_segments(self, ui, segs):
+    """write segments to flash"""
+    for (adr, data) in segs:
+      ui.put('writing 0x%08x-0x%08x (%d bytes): ' % (adr, adr + len(data) - 1, len(data)))
+      t_start = time.time()
+      self.cache.invalidate(adr, len(data))
+      io = iobuf.data_buffer(32)
+      io.from_bytes(data, 'le')
+      self.driver.write(mem.region(None, adr, len(data)), io)
+      ui.put('done (%.2f KiB/sec)\n' % (float(len(data)) / ((time.time() - t_start) * 1024.0)))
+
+  def program_segments(self, ui, name, segs, compress):
+    """erase the sectors touched by the segments and write them"""
+    sectors = self.segment_sectors(segs)
+    ui.put('%s: %d segments (%d bytes) in %d sectors\n' % (name, len(segs), sum([len(data) for (_, data) in segs]), len(sectors)))
+    self.erase_sectors(ui, sectors)
+    if compress and not self.lz_start(ui):
+      return
+    self.write_segments(ui, segs)
+    if compress:
+      self.lz_stop(ui)
+
+  def verify_crc(self, ui, name, segs):
+    """verify flash against file segments with on-target sector crc32s: return False if not possible"""
+    # (adr, n, expected data) for each sector range
+    ranges = []
+    for (adr, data) in segs:
+      ranges.extend([(a, n, data[a - adr:a - adr + n]) for (a, n) in self.file_ranges(adr, len(data))])
+    t_start = time.time()
+    crcs = self.cache.rd_crc32s([(a, n) for (a, n, _) in ranges])
+    if crcs is None:
+      return False
+    nbytes = sum([len(data) for (_, data) in segs])
+    ui.put('verify %s (%d bytes, crc32 of %d sectors): ' % (name, nbytes, len(ranges)))
+    bad = [(a, n, data) for ((a, n, data), crc) in zip(ranges, crcs) if crc != zlib.crc32(data)]
+    # read back the mismatched sectors
+    n_diff = 0
+    for (a, n, data) in bad:
+      x = self.mem.cpu.rdbytes(a, n)
+      n_diff += sum([1 for (y, z) in zip(x, data) if y != z])
+    t = time.time() - t_start
+    if n_diff == 0 and not bad:
+      ui.put('same (%.2f secs)\n' % t)
+    else:
+      ui.put('%d byte differences in %d sectors (%.2f secs)\n' % (n_diff, len(bad), t))
+      for (a, n, _) in bad:
+        ui.put('  0x%08x-0x%08x\n' % (a, a + n - 1))
+    return True
+
+  def verify_readback(self, ui, name, segs):
+    """verify flash against file segments by reading back the flash"""
+    nbytes = sum([len(data) for (_, data) in segs])
+    ui.put('verify %s (%d bytes, readback of %d segments): ' % (name, nbytes, len(segs)))
+    n_diff = 0
+    for (adr, data) in segs:
+      x = self.mem.cpu.rdbytes(adr, len(data))
+      n_diff += sum([1 for (y, z) in zip(x, data) if y != z])
+    if n_diff == 0:
+      ui.put('same\n')
+    else:
+      ui.put('%d byte differences\n' % n_diff)
+
+  def program_delta(self, ui, name, segs, compress):
+    """erase and write the sectors that differ from the file segments: return False if not possible, None for an error"""
+    sectors = self.segment_sectors(segs)
+    t_start = time.time()
+    crcs = self.cache.rd_crc32s([(x.adr, x.size) for x in sectors])
+    if crcs is None:
+      return False
+    # the expected sector content: file data, erased (0xff) elsewhere
+    writes = []
+    for (x, crc) in zip(sectors, crcs):
+      expected = bytearray(b'\xff' * x.size)
+      for (adr, data) in segs:
+        a = max(x.adr, adr)
+        k = min(x.end + 1, adr + len(data)) - a
+        if k > 0:
+          expected[a - x.adr:a - x.adr + k] = data[a - adr:a - adr + k]
+      expected = bytes(expected)
+      if crc != zlib.crc32(expected):
+        # don't write the erased bytes at the end of the sector
+        wr = expected.rstrip(b'\xff')
+        wr += b'\xff' * (-len(wr) % self.write_align())
+        writes.append((x, wr))
+    # display the plan
+    ui.put('delta: %d sectors, %d unchanged, %d to erase and write (%d bytes)\n' %
+      (len(sectors), len(sectors) - len(writes), len(writes), sum([len(wr) for (_, wr) in writes])))
+    if writes:
+      ui.put('%s\n' % util.display_cols([x.col_str() for (x, _) in writes]))
+    for (x, wr) in writes:
+      if wr:
+        msg = self.driver.check_region(mem.region(None, x.adr, len(wr)))
+        if msg is not None:
+          ui.put('%s\n' % msg)
+          return None
+    if compress and not self.lz_start(ui):
+      return None
+    # erase and write
+    n_errors = 0
+    # keep the flash unlocked for the batch
+    hold = hasattr(self.driver, 'hold')
+    try:
+      if hold:
+        self.driver.hold(True)
+      for (x, wr) in writes:
+        self.cache.invalidate(x.adr, x.size)
+        n_errors += self.driver.erase(x)
+        if wr:
+          io = iobuf.data_buffer(32)
+          io.from_bytes(wr, 'le')
+          self.driver.write(mem.region(None, x.adr, len(wr)), io)
+    finally:
+      if hold:
+        self.driver.hold(False)
+    ui.put('done (%d erase errors, %.2f secs)\n' % (n_errors, time.time() - t_start))
+    if compress:
+      self.lz_stop(ui)
+    return True
 
   def cmd_program(self, ui, args):
     """program firmware file to flash"""
-    if util.wrong_argc(ui, args, (1,)):
+    if util.wrong_argc(ui, args, (1, 2, 3, 4)):
       return None
+    opts = args[1:]
+    for x in opts:
+      if x not in ('--delta', '--readback', '--lz'):
+        ui.put('bad argument: %s\n' % x)
+        return
     x = util.file_arg(ui, args[0])
     if x is None:
       return
-    # erase all
-    self.cmd_erase(ui, ('*',))
-    # write to flash
+    segs = self.file_segments(ui, args[0])
+    if segs is None:
+      return
+    # ELF, Intel HEX and S-record files may be sparse
+    sparse = firmware.file_type(args[0]) is not None
     region_name = self.driver.firmware_region()
-    self.cmd_write(ui, (args[0], region_name))
+    compress = '--lz' in opts
+    done = False
+    if '--delta' in opts:
+      done = self.program_delta(ui, args[0], segs, compress)
+      if done is None:
+        return
+    if not done:
+      if sparse:
+        # erase and write the populated ranges
+        self.program_segments(ui, args[0], segs, compress)
+      else:
+        # erase all
+        self.cmd_erase(ui, ('*',))
+        # write to flash
+        self.cmd_write(ui, (args[0], region_name) + (('--lz',) if compress else ()))
+    # check the cached images of the flash
+    self.cache.revalidate(ui)
     # verify against the file
-    self.mem.cmd_verify(ui, (args[0], region_name))
+    if '--readback' not in opts:
+      if self.verify_crc(ui, args[0], segs):
+        return
+    if sparse:
+      self.verify_readback(ui, args[0], segs)
+    else:
+      self.mem.cmd_verify(ui, (args[0], region_name))
 
 #-----------------------------------------------------------------------------
@@ -0,0 +1,290 @@
+#-----------------------------------------------------------------------------
+"""
+
+FreeRTOS Thread Awareness
+
+Find the FreeRTOS kernel lists with the symbol table, walk them to find the
+tasks and decode the task control blocks. Memory is read in aligned blocks
+that are kept for the duration of a command, so list nodes and the TCBs
+that contain them are usually fetched together.
+
+Assumes a 32-bit port with the default structure options
+(no MPU wrappers, no list integrity check bytes).
+
+"""
+#-----------------------------------------------------------------------------
+
+import util
+import cstruct
+
+#-----------------------------------------------------------------------------
+
+help_regs = (
+  ('<task>', 'display the stacked registers of a task'),
+  ('  task', 'task name or TCB address'),
+)
+
+#-----------------------------------------------------------------------------
+
+# configMAX_TASK_NAME_LEN
+_name_len = 16
+
+# tskSTACK_FILL_BYTE
+_stack_fill = 0xa5
+
+# limit for list walks (guards against corrupted lists)
+_max_tasks = 256
+
+# prefetch block size
+_block_size = 256
+
+# limit for the stack high water mark scan
+_stack_max = 64 << 10
+
+ListItem_t = cstruct.layout('ListItem_t', (
+  ('xItemValue', 0, 'u32'),
+  ('pxNext', 4, 'u32'),
+  ('pxPrevious', 8, 'u32'),
+  ('pvOwner', 12, 'u32'),
+  ('pvContainer', 16, 'u32'),
+))
+
+MiniListItem_t = cstruct.layout('MiniListItem_t', (
+  ('xItemValue', 0, 'u32'),
+  ('pxNext', 4, 'u32'),
+  ('pxPrevious', 8, 'u32'),
+))
+
+List_t = cstruct.layout('List_t', (
+  ('uxNumberOfItems', 0, 'u32'),
+  ('pxIndex', 4, 'u32'),
+  ('xListEnd', 8, MiniListItem_t),
+))
+
+TCB_t = cstruct.layout('TCB_t', (
+  ('pxTopOfStack', 0, 'u32'),
+  ('xStateListItem', 4, ListItem_t),
+  ('xEventListItem', 24, ListItem_t),
+  ('uxPriority', 44, 'u32'),
+  ('pxStack', 48, 'u32'),
+  ('pcTaskName', 52, 'char', _name_len),
+))
+
+# kernel lists and the state of the tasks on them
+_kernel_lists = (
+  ('pxReadyTasksLists', 'ready'),
+  ('xPendingReadyList', 'ready'),
+  ('xDelayedTaskList1', 'blocked'),
+  ('xDelayedTaskList2', 'blocked'),
+  ('xSuspendedTaskList', 'suspended'),
+  ('xTasksWaitingTermination', 'deleted'),
+)
+
+# stacked registers (ARM_CM0/CM3/CM4F ports)
+_sw_frame = ('r4', 'r5', 'r6', 'r7', 'r8', 'r9', 'r10', 'r11')
+_hw_frame = ('r0', 'r1', 'r2', 'r3', 'r12', 'lr', 'pc', 'psr')
+
+#-----------------------------------------------------------------------------
+
+class prefetch(object):
+  """read memory in aligned blocks and keep them"""
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.blocks = {}
+    self.nreads = 0
+    self.nbytes = 0
+
+  def rd(self, adr, n):
+    """return n bytes at adr"""
+    first = adr // _block_size
+    last = (adr + n - 1) // _block_size
+    # read the missing blocks with contiguous reads
+    i = first
+    while i <= last:
+      if i in self.blocks:
+        i += 1
+        continue
+      j = i
+      while j + 1 <= last and (j + 1) not in self.blocks:
+        j += 1
+      data = self.cpu.rdbytes(i * _block_size, (j + 1 - i) * _block_size)
+      self.nreads += 1
+      self.nbytes += len(data)
+      for k in range(i, j + 1):
+        ofs = (k - i) * _block_size
+        self.blocks[k] = data[ofs:ofs + _block_size]
+      i = j + 1
+    data = b''.join([self.blocks[k] for k in range(first, last + 1)])
+    ofs = adr - (first * _block_size)
+    return data[ofs:ofs + n]
+
+  def rd_struct(self, layout, adr):
+    """read a structure"""
+    return layout.unpack(self.rd(adr, layout.size), 0, adr)
+
+#-----------------------------------------------------------------------------
+
+class task(object):
+  """a FreeRTOS task"""
+
+  def __init__(self, tcb, state):
+    self.tcb = tcb
+    self.adr = tcb._adr
+    self.name = tcb.pcTaskName
+    self.state = state
+    self.priority = tcb.uxPriority
+    self.sp = tcb.pxTopOfStack
+    self.stack = tcb.pxStack
+    self.free = None
+
+#-----------------------------------------------------------------------------
+
+class freertos(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.symbols = cpu.symbols
+    self.menu = (
+      ('regs', self.cmd_regs, help_regs),
+      ('tasks', self.cmd_tasks),
+    )
+
+  def kernel_lists(self, ui):
+    """return a list of (list address, state) - or None"""
+    lists = []
+    for (name, state) in _kernel_lists:
+      x = self.symbols.find(name)
+      if x is None:
+        ui.put('symbol %s not found (is this a FreeRTOS image?)\n' % name)
+        return None
+      (adr, size) = x
+      # pxReadyTasksLists is an array of lists
+      for i in range(max(size // List_t.size, 1)):
+        lists.append((adr + (i * List_t.size), state))
+    return lists
+
+  def walk(self, mem, list_adr):
+    """return the TCB addresses on a list"""
+    end = list_adr + 8
+    item = mem.rd_struct(List_t, list_adr).xListEnd.pxNext
+    tcbs = []
+    while item != end and item != 0 and len(tcbs) < _max_tasks:
+      x = mem.rd_struct(ListItem_t, item)
+      # prefetch the TCB that contains this list item
+      mem.rd(x.pvOwner, TCB_t.size)
+      tcbs.append(x.pvOwner)
+      item = x.pxNext
+    return tcbs
+
+  def stack_free(self, t):
+    """return the number of unused stack bytes (the stack high water mark)"""
+    n = 0
+    adr = t.stack
+    fill = bytes((_stack_fill,)) * _block_size
+    # the saved sp of the running task is stale, so scan to the first used byte
+    while n < _stack_max:
+      k = _block_size - (adr % _block_size)
+      data = self.cpu.rdbytes(adr, k)
+      if data != fill[:k]:
+        return n + len(data) - len(data.lstrip(fill[:1]))
+      n += k
+      adr += k
+    return n
+
+  def tasks(self, ui):
+    """return (the list of tasks, the memory reader) - or None"""
+    if self.symbols.name is None:
+      ui.put('no symbols loaded (see "cpu symbols")\n')
+      return None
+    lists = self.kernel_lists(ui)
+    if lists is None:
+      return None
+    x = self.symbols.find('pxCurrentTCB')
+    current = None
+    mem = prefetch(self.cpu)
+    if x is not None:
+      current = int.from_bytes(mem.rd(x[0], 4), 'little')
+    # read all of the kernel lists
+    lo = min([adr for (adr, _) in lists])
+    hi = max([adr for (adr, _) in lists]) + List_t.size
+    if hi - lo <= 4 * _block_size:
+      mem.rd(lo, hi - lo)
+    tasks = []
+    for (adr, state) in lists:
+      for tcb_adr in self.walk(mem, adr):
+        tcb = mem.rd_struct(TCB_t, tcb_adr)
+        s = state
+        if tcb_adr == current:
+          s = 'running'
+        elif state == 'suspended' and tcb.xEventListItem.pvContainer != 0:
+          # waiting for an event without a timeout
+          s = 'blocked'
+        tasks.append(task(tcb, s))
+    return (tasks, mem)
+
+  def cmd_tasks(self, ui, args):
+    """display the tasks"""
+    x = self.tasks(ui)
+    if x is None:
+      return
+    (tasks, mem) = x
+    cols = [['TCB', 'Name', 'State', 'Prio', 'SP', 'Stack', 'Free']]
+    for t in tasks:
+      t.free = self.stack_free(t)
+      cols.append(['%08x' % t.adr, t.name, t.state, '%d' % t.priority, '%08x' % t.sp, '%08x' % t.stack, '%d' % t.free])
+    ui.put('%s\n' % util.display_cols(cols))
+    ui.put('%d tasks, %d reads (%d bytes) for the kernel lists and TCBs\n' % (len(tasks), mem.nreads, mem.nbytes))
+
+  def stacked_regs(self, t):
+    """return [(name, value)] for the registers stacked by the context switch"""
+    fpu = 'FPU' in self.cpu.device.peripherals
+    names = list(_sw_frame)
+    if fpu:
+      # CM4F port: exc_return is saved with r4-r11
+      names.append('exc_return')
+    data = self.cpu.rdbytes(t.sp, 4 * len(names))
+    regs = list(zip(names, [int.from_bytes(data[i:i + 4], 'little') for i in range(0, len(data), 4)]))
+    adr = t.sp + len(data)
+    if fpu and (regs[-1][1] & (1 << 4)) == 0:
+      # s16-s31 were stacked
+      adr += 16 * 4
+    data = self.cpu.rdbytes(adr, 4 * len(_hw_frame))
+    regs.extend(zip(_hw_frame, [int.from_bytes(data[i:i + 4], 'little') for i in range(0, len(data), 4)]))
+    sp = adr + len(data)
+    if fpu and (regs[8][1] & (1 << 4)) == 0:
+      # s0-s15, fpscr, reserved
+      sp += 18 * 4
+    regs.append(('sp', sp))
+    return regs
+
+  def cmd_regs(self, ui, args):
+    """display the stacked registers of a task"""
+    if util.wrong_argc(ui, args, (1,)):
+      return
+    x = self.tasks(ui)
+    if x is None:
+      return
+    (tasks, _) = x
+    adr = None
+    try:
+      adr = int(args[0], 16)
+    except ValueError:
+      pass
+    t = [t for t in tasks if t.name == args[0] or t.adr == adr]
+    if not t:
+      ui.put('no task %s\n' % args[0])
+      return
+    t = t[0]
+    if t.state == 'running':
+      ui.put('%s is running: see the cpu registers\n' % t.name)
+      return
+    cols = []
+    for (name, val) in self.stacked_regs(t):
+      where = ''
+      if name in ('pc', 'lr'):
+        where = self.symbols.annotate(val & ~1)
+      cols.append([name, ': %08x' % val, where])
+    ui.put('%s\n' % util.display_cols(cols))
+
+#-----------------------------------------------------------------------------
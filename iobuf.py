@@ -5,11 +5,15 @@ Stateful objects used to produce/consume data from JTAG devices
 """
 # ----------------------------------------------------------------------------
 
+import os
 import sys
 import string
 import struct
 import hashlib
 import time
+import threading
+import queue
+import gzip
 
 sys.path.append('./darm/darm-master')
 import darm
@@ -24,10 +28,24 @@ printable = string.ascii_letters + string.digits + string.punctuation + ' '
 class arm_disassemble:
   """disassemble incoming data into ARM instructions"""
 
-  def __init__(self, ui, adr):
+  def __init__(self, ui, adr, symbols=None):
     self.ui = ui
     self.pc = adr
     self.state = 'thumb'
+    self.symbols = symbols
+    self.where = None
+
+  def label(self):
+    """display the symbol and line when they change"""
+    if self.symbols is None:
+      return
+    x = self.symbols.lookup(self.pc)
+    where = (x and x[0], self.symbols.line(self.pc))
+    if where != self.where:
+      self.where = where
+      s = self.symbols.annotate(self.pc)
+      if s:
+        self.ui.put('%s:\n' % s)
 
   def emit_thumb(self, opcode):
     """16 bit thumb instructions"""
@@ -35,6 +53,7 @@ class arm_disassemble:
     s = '?'
     if da:
       s = str(da)
+    self.label()
     self.ui.put('%08x: %04x       %s\n' % (self.pc, opcode, s))
     self.pc += 2
 
@@ -44,6 +63,7 @@ class arm_disassemble:
     s = '?'
     if da:
       s = str(da)
+    self.label()
     self.ui.put('%08x: %04x %04x  %s\n' % (self.pc, opcode >> 16, opcode & 0xffff, s))
     self.pc += 4
 
@@ -119,6 +139,126 @@ class write_file(object):
 
 #-----------------------------------------------------------------------------
 
+class block_file(object):
+  """
+  write (address, bytes) blocks to a file from a writer thread
+  raw: the memory image
+  gz: the memory image, gzip compressed
+  sparse: the memory image with holes for 0x00 runs
+  ihex: intel hex records, 0xff runs are skipped
+  """
+
+  fmts = ('raw', 'gz', 'sparse', 'ihex')
+
+  def __init__(self, name, fmt = 'raw', depth = 8):
+    assert fmt in self.fmts, 'bad file format %s' % fmt
+    self.name = name
+    self.fmt = fmt
+    if fmt == 'gz':
+      self.f = gzip.open(name, 'wb')
+    elif fmt == 'ihex':
+      self.f = open(name, 'w')
+    else:
+      self.f = open(name, 'wb')
+    self.base = None
+    self.size = 0
+    # upper 16 bits of the intel hex address
+    self.ela = None
+    # bytes written to the file
+    self.n = 0
+    self.error = None
+    # the queue is bounded so the reader can't get too far ahead
+    self.q = queue.Queue(depth)
+    self.thread = threading.Thread(target = self.writer)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def wr_raw(self, adr, data):
+    self.f.write(data)
+    self.n += len(data)
+
+  def wr_sparse(self, adr, data, chunk = 4096):
+    zeroes = bytes(chunk)
+    for i in range(0, len(data), chunk):
+      x = data[i:i + chunk]
+      if x == zeroes[:len(x)]:
+        # leave a hole
+        self.f.seek(len(x), 1)
+      else:
+        self.f.write(x)
+        self.n += len(x)
+
+  def wr_ihex_record(self, adr, rtype, data):
+    x = bytes((len(data), (adr >> 8) & 0xff, adr & 0xff, rtype)) + data
+    s = ':%s%02X\n' % (x.hex().upper(), -sum(x) & 0xff)
+    self.f.write(s)
+    self.n += len(s)
+
+  def wr_ihex(self, adr, data, chunk = 16):
+    ones = b'\xff' * chunk
+    i = 0
+    while i < len(data):
+      a = adr + i
+      # end the record on a chunk boundary, so it can't cross a 64K segment
+      n = min(chunk - (a % chunk), len(data) - i)
+      x = data[i:i + n]
+      i += n
+      if x == ones[:n]:
+        # erased memory
+        continue
+      if (a >> 16) != self.ela:
+        # extended linear address record
+        self.ela = a >> 16
+        self.wr_ihex_record(0, 4, struct.pack('>H', self.ela))
+      self.wr_ihex_record(a & 0xffff, 0, x)
+
+  def writer(self):
+    """writer thread: drain the queue to the file"""
+    wr = {
+      'raw': self.wr_raw,
+      'gz': self.wr_raw,
+      'sparse': self.wr_sparse,
+      'ihex': self.wr_ihex,
+    }[self.fmt]
+    while True:
+      x = self.q.get()
+      if x is None:
+        break
+      if self.error is None:
+        try:
+          wr(*x)
+        except (IOError, OSError) as e:
+          # keep draining the queue so the reader doesn't block
+          self.error = e
+
+  def put(self, adr, data):
+    """queue a block of data for writing"""
+    if self.base is None:
+      self.base = adr
+    self.size = adr + len(data) - self.base
+    self.q.put((adr, data))
+
+  def close(self):
+    """wait for the writer thread and close the file: return any write error"""
+    self.q.put(None)
+    self.thread.join()
+    if self.error is None:
+      try:
+        if self.fmt == 'sparse':
+          # the file may end with a hole
+          self.f.truncate(self.size)
+        elif self.fmt == 'ihex':
+          self.wr_ihex_record(0, 1, b'')
+      except (IOError, OSError) as e:
+        self.error = e
+    self.f.close()
+    if self.fmt == 'gz' and self.error is None:
+      # report the compressed size
+      self.n = os.path.getsize(self.name)
+    return self.error
+
+#-----------------------------------------------------------------------------
+
 class read_file(object):
 
   def __init__(self, ui, msg, name, size, mode = 'le'):
@@ -146,7 +286,7 @@ class read_file(object):
     val = self.f.read(4)
     n = len(val)
     if n != 4:
-      val = ''.join([val, '\xff' * (4 - n)])
+      val = b''.join([val, b'\xff' * (4 - n)])
     self.n += 4
     self.progress.update(self.n)
     return struct.unpack(self.fmt32, val)[0]
@@ -155,7 +295,7 @@ class read_file(object):
     val = self.f.read(2)
     n = len(val)
     if n != 2:
-      val = ''.join([val, '\xff' * (2 - n)])
+      val = b''.join([val, b'\xff' * (2 - n)])
     self.n += 2
     self.progress.update(self.n)
     return struct.unpack(self.fmt16, val)[0]
@@ -164,7 +304,7 @@ class read_file(object):
     val = self.f.read(1)
     n = len(val)
     if n == 0:
-      val = '\xff'
+      val = b'\xff'
     self.n += 1
     self.progress.update(self.n)
     return struct.unpack('B', val)[0]
@@ -204,7 +344,7 @@ class verify_file(object):
     val = self.f.read(4)
     n = len(val)
     if n != 4:
-      val = ''.join([val, '\xff' * (4 - n)])
+      val = b''.join([val, b'\xff' * (4 - n)])
     return struct.unpack(self.fmt32, val)[0]
 
   def wr32(self, val):
@@ -448,6 +588,21 @@ class data_buffer(object):
     assert self.width == 8, 'width must be 8 bits'
     return ''.join([('.', chr(b))[chr(b) in printable] for b in self.buf])
 
+  def from_bytes(self, data, mode):
+    """set the buffer contents from a bytes object"""
+    fmt = {8: 'B', 16: 'H', 32: 'L'}[self.width]
+    order = ('>', '<')[mode == 'le']
+    n = len(data) // (self.width >> 3)
+    self.buf = list(struct.unpack('%s%d%s' % (order, n, fmt), data[:n * (self.width >> 3)]))
+    self.wr_idx = len(self.buf)
+    self.rd_idx = 0
+
+  def to_bytes(self, mode):
+    """return the buffer as a bytes object"""
+    fmt = {8: 'B', 16: 'H', 32: 'L'}[self.width]
+    order = ('>', '<')[mode == 'le']
+    return struct.pack('%s%d%s' % (order, len(self.buf), fmt), *self.buf)
+
   def to_str(self):
     """convert an 8-bit buffer to a string"""
     assert self.width == 8, 'width must be 8 bits'
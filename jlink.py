@@ -492,6 +492,19 @@ class dbgio(object):
       n -= nread
       adr += nread * 4
 
+  def probe_rd32(self, adr, n):
+    """read n 32-bit words from memory: return False if the read faults"""
+    max_n = 16
+    while n > 0:
+      nread = (n, max_n)[n >= max_n]
+      try:
+        self.jlink.rdmem32(adr, nread)
+      except JLinkException:
+        return False
+      n -= nread
+      adr += nread * 4
+    return True
+
   def rdmem16(self, adr, n, io):
     """read n 16-bit values from memory region"""
     max_n = 32
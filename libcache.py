@@ -0,0 +1,82 @@
+#-----------------------------------------------------------------------------
+"""
+
+Library Routine Cache
+
+Track the library routines that are resident in target ram so they are not
+reloaded on every use. A checksum word is written after the code of each
+routine. A routine is reused if the checksum still matches (a single read),
+so code that has been overwritten by the target is loaded again.
+Host writes that overlap a routine and cpu resets invalidate it.
+The checksum word is part of the ram footprint (see cortexm.sizeof_lib).
+
+"""
+#-----------------------------------------------------------------------------
+
+import zlib
+import struct
+
+import iobuf
+
+#-----------------------------------------------------------------------------
+
+class resident(object):
+  """a library routine in target ram"""
+
+  def __init__(self, adr, size, crc):
+    self.adr = adr
+    # code + checksum word
+    self.end = adr + size + 3
+    self.crc = crc
+
+  def overlap(self, adr, end):
+    """return True if the routine overlaps adr..end"""
+    return max(self.adr, adr) <= min(self.end, end)
+
+#-----------------------------------------------------------------------------
+
+class libcache(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.libs = []
+    # number of loads and reloads skipped
+    self.loads = 0
+    self.hits = 0
+
+  def checksum(self, lib):
+    """return the checksum of a library routine (code and load address)"""
+    code = struct.pack('<%dL' % len(lib['code']), *lib['code'])
+    return zlib.crc32(code, lib['load'])
+
+  def load(self, lib):
+    """load a library routine to ram if it is not resident"""
+    # the cpu must be halted
+    adr = lib['load']
+    size = len(lib['code']) * 4
+    crc = self.checksum(lib)
+    for x in self.libs:
+      if x.adr == adr and x.crc == crc:
+        if self.cpu.dbgio.rd32(adr + size) == crc:
+          self.hits += 1
+          return
+        break
+    # write the code and checksum word
+    code = iobuf.data_buffer(32, tuple(lib['code']) + (crc,))
+    self.cpu.wrmem(adr, len(code), code)
+    self.libs.append(resident(adr, size, crc))
+    self.loads += 1
+
+  def invalidate(self, adr, n):
+    """invalidate the routines overlapping a memory write"""
+    end = adr + n - 1
+    self.libs = [x for x in self.libs if not x.overlap(adr, end)]
+
+  def reset(self):
+    """invalidate all routines"""
+    self.libs = []
+
+  def __str__(self):
+    return '%d resident, %d loads, %d reloads skipped' % (len(self.libs), self.loads, self.hits)
+
+#-----------------------------------------------------------------------------
@@ -0,0 +1,157 @@
+#-----------------------------------------------------------------------------
+"""
+
+RAM Loader
+
+Load the PT_LOAD segments of an ELF file to ram and optionally run it.
+Segments are only written if they have changed. A segment whose host CRC32
+matches the previous load is confirmed with a CRC32 computed on the target,
+so reloading an unchanged image transfers very little data.
+
+"""
+#-----------------------------------------------------------------------------
+
+import struct
+import time
+import zlib
+
+import util
+import elf
+import mem
+import cmlib
+import cortexm
+
+#-----------------------------------------------------------------------------
+
+help_load = (
+  ('<file> [--run]', 'load an ELF file to ram'),
+  ('  file', 'ELF file name'),
+  ('  --run', 'set sp/pc from the vector table and run'),
+)
+
+#-----------------------------------------------------------------------------
+
+class loader(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.device = cpu.device
+    # (adr, size) -> crc32 for the segments of the previous load
+    self.loaded = {}
+
+  def ram_regions(self):
+    """return the ram regions for the device"""
+    regions = []
+    for p in self.device.peripheral_list():
+      if p.registers is None and p.size and 'ram' in p.name.lower():
+        regions.append(mem.region(p.name, p.address, p.size))
+    return regions
+
+  def scratch(self, lib, segs):
+    """return a ram region for the crc routine that does not overlap the segments - or None"""
+    lib_size = cortexm.sizeof_lib(lib)
+    # code, 1 KiB table, 4 byte result
+    size = lib_size + 1024 + 4
+    for r in sorted(self.ram_regions(), key=lambda x: -x.size):
+      x = mem.region(None, util.align(r.end + 1 - size, 32), size)
+      if x.adr < r.adr:
+        continue
+      if not any([x.overlap(mem.region(None, adr, len(data))) for (adr, data) in segs]):
+        return x
+    return None
+
+  def target_crcs(self, segs):
+    """return the on-target crc32 for each segment (None if not possible) and the bytes transferred"""
+    x = self.scratch(cmlib.mem_crc32, segs)
+    if x is None:
+      return ([None,] * len(segs), 0)
+    lib = cortexm.relocate_lib(cmlib.mem_crc32, x.adr)
+    ws = x.adr + cortexm.sizeof_lib(lib)
+    ctx = self.cpu.save_context(x)
+    self.cpu.loadlib(lib)
+    crcs = []
+    for (adr, data) in segs:
+      self.cpu.runlib(lib, (adr, 1, len(data), ws))
+      crcs.append(self.cpu.dbgio.rd32(ws + 1024))
+    self.cpu.restore_context(ctx)
+    # ram save/restore, code, results
+    return (crcs, (2 * x.size) + cortexm.sizeof_lib(lib) + (4 * len(segs)))
+
+  def check_segments(self, ui, segs):
+    """return True if all segments are within ram"""
+    regions = self.ram_regions()
+    for (adr, data) in segs:
+      if not any([r.adr <= adr and adr + len(data) - 1 <= r.end for r in regions]):
+        ui.put('segment 0x%08x-0x%08x is not in ram\n' % (adr, adr + len(data) - 1))
+        return False
+    return True
+
+  def run(self, ui, adr, vtable):
+    """set sp/pc from a vector table and run"""
+    (sp, pc) = vtable
+    ui.put('vector table 0x%08x: sp 0x%08x pc 0x%08x\n' % (adr, sp, pc))
+    if 'VTOR' in self.device.SCB.registers:
+      self.device.SCB.VTOR.wr(adr)
+    self.cpu.wrreg('msp', sp)
+    self.cpu.wrreg('r13', sp)
+    self.cpu.wrreg('pc', pc & ~1)
+    # thumb state
+    self.cpu.wrreg('psr', 1 << 24)
+    self.cpu.go()
+
+  def cmd_load(self, ui, args):
+    """load an ELF file to ram"""
+    if util.wrong_argc(ui, args, (1, 2)):
+      return
+    run = False
+    if len(args) == 2:
+      if args[1] != '--run':
+        ui.put('bad argument: %s\n' % args[1])
+        return
+      run = True
+    try:
+      x = elf.elf(args[0])
+    except (IOError, OSError, elf.Error) as e:
+      ui.put('%s\n' % e)
+      return
+    segs = x.load_segments()
+    if not segs:
+      ui.put('%s: no loadable segments\n' % args[0])
+      return
+    if not self.check_segments(ui, segs):
+      return
+    self.cpu.halt()
+    t_start = time.time()
+    host_crcs = [zlib.crc32(data) for (_, data) in segs]
+    # confirm the segments that are unchanged since the last load
+    check = [i for (i, (adr, data)) in enumerate(segs) if self.loaded.get((adr, len(data))) == host_crcs[i]]
+    target_crcs = [None,] * len(segs)
+    n_check = 0
+    if check:
+      (crcs, n_check) = self.target_crcs([segs[i] for i in check])
+      for (i, crc) in zip(check, crcs):
+        target_crcs[i] = crc
+    # write the changed segments
+    self.loaded = {}
+    n = 0
+    nwritten = 0
+    for (i, (adr, data)) in enumerate(segs):
+      if target_crcs[i] != host_crcs[i]:
+        self.cpu.wrbytes(adr, data)
+        self.cpu.cache.invalidate(adr, len(data))
+        n += len(data)
+        nwritten += 1
+      self.loaded[(adr, len(data))] = host_crcs[i]
+    t = time.time() - t_start
+    total = sum([len(data) for (_, data) in segs])
+    ui.put('%d of %d segments written (%d of %d bytes)\n' % (nwritten, len(segs), n, total))
+    ui.put('%d bytes transferred (%d for crc checks) in %.2f secs\n' % (n + n_check, n_check, t))
+    if run:
+      # the vector table is at the start of the lowest segment
+      (adr, data) = min(segs)
+      if len(data) < 8:
+        ui.put('no vector table at 0x%08x\n' % adr)
+        return
+      self.run(ui, adr, struct.unpack('<2L', data[:8]))
+
+#-----------------------------------------------------------------------------
@@ -0,0 +1,115 @@
+#-----------------------------------------------------------------------------
+"""
+
+LZ Compression
+
+A simple LZ77 format that is fast to expand on the target (see cmlib/mem_unlz.S).
+The compressed data is a sequence of:
+
+0x00..0x7f: literal run, (n + 1) bytes follow
+0x80..0xff: match, (n & 0x7f) + 3 bytes copied from (dst - offset),
+            the offset is the following 2 bytes (little endian)
+
+Matches are found greedily with a hash of the last position of each 3 byte
+sequence. A match may overlap the output, so runs of padding bytes compress
+to a few bytes per 130 bytes.
+
+"""
+#-----------------------------------------------------------------------------
+
+_lit_max = 0x80
+_match_min = 3
+_match_max = 0x7f + _match_min
+_window = 0xffff
+
+#-----------------------------------------------------------------------------
+
+def compress(data):
+  """return the compressed data"""
+  out = bytearray()
+  n = len(data)
+  last = {}
+  lit = 0
+  i = 0
+
+  def literals(end):
+    """output the literal bytes ending at end"""
+    k = end - lit
+    while k < end:
+      m = min(end - k, _lit_max)
+      out.append(m - 1)
+      out.extend(data[k:k + m])
+      k += m
+
+  while i < n:
+    key = data[i:i + _match_min]
+    j = last.get(key)
+    last[key] = i
+    (length, ofs) = (0, 0)
+    # prefer a run (offset 1) when it is at least as long
+    if i > 0:
+      while length < _match_max and i + length < n and data[i + length] == data[i - 1]:
+        length += 1
+        ofs = 1
+    if j is not None and i - j <= _window and len(key) == _match_min:
+      k = 0
+      while k < _match_max and i + k < n and data[j + k] == data[i + k]:
+        k += 1
+      if k > length:
+        (length, ofs) = (k, i - j)
+    if length >= _match_min:
+      literals(i)
+      lit = 0
+      out.append(0x80 | (length - _match_min))
+      out.append(ofs & 0xff)
+      out.append(ofs >> 8)
+      # index the skipped positions (sparsely for long matches)
+      for k in range(i + 1, i + length, (1, 8)[length > 32]):
+        last[data[k:k + _match_min]] = k
+      i += length
+    else:
+      lit += 1
+      i += 1
+  literals(n)
+  return bytes(out)
+
+def decompress(data):
+  """return the decompressed data"""
+  out = bytearray()
+  i = 0
+  while i < len(data):
+    c = data[i]
+    if c < 0x80:
+      out.extend(data[i + 1:i + c + 2])
+      i += c + 2
+    else:
+      k = len(out) - (data[i + 1] | (data[i + 2] << 8))
+      for j in range((c & 0x7f) + _match_min):
+        out.append(out[k + j])
+      i += 3
+  return bytes(out)
+
+#-----------------------------------------------------------------------------
+
+class stats(object):
+  """compression statistics for a programming operation"""
+
+  def __init__(self):
+    self.nbytes = 0
+    self.nsent = 0
+    self.nblocks = 0
+    self.ncompressed = 0
+
+  def add(self, nbytes, nsent):
+    """add a block of nbytes uploaded as nsent bytes"""
+    self.nbytes += nbytes
+    self.nsent += nsent
+    self.nblocks += 1
+    if nsent < nbytes:
+      self.ncompressed += 1
+
+  def __str__(self):
+    ratio = float(self.nbytes) / self.nsent if self.nsent else 1.0
+    return 'compressed %d -> %d bytes (%.2f:1), %d of %d blocks compressed' % (self.nbytes, self.nsent, ratio, self.ncompressed, self.nblocks)
+
+#-----------------------------------------------------------------------------
@@ -4,20 +4,25 @@ Memory Functions
 """
 # -----------------------------------------------------------------------------
 
+import os
 import math
+import struct
+import zlib
 import util
 import iobuf
 import time
-import random
+import cortexm
+import cmlib
 
 # -----------------------------------------------------------------------------
 
 _help_mem_2file = (
-  ('<filename> <address/name> [len]', 'read from memory, write to file'),
+  ('<filename> <address/name> [len] [fmt]', 'read from memory, write to file'),
   ('  filename', 'name of file'),
   ('  address', 'address of memory (hex)'),
     ('  name', 'name of memory region - see "map" command'),
   ('  len', 'length of memory region (hex)'),
+  ('  fmt', 'file format: --gz, --sparse (holes for 0x00), --ihex (skip 0xff)'),
 )
 
 _help_mem_verify = (
@@ -35,6 +40,43 @@ _help_mem_region = (
   ('  len', 'length of memory region (hex) - defaults to region size or 0x40'),
 )
 
+_help_mem_find = (
+  ('<address/name> [len] <pattern> [--align N]', 'find a pattern in memory'),
+  ('  address', 'address of memory (hex)'),
+  ('  name', 'name of memory region - see "map" command'),
+  ('  len', 'length of memory region (hex) - defaults to region size'),
+  ('  pattern', 'bytes to find (hex) e.g. efbeadde, or a "string"'),
+  ('  N', 'only report matches aligned to N bytes (hex)'),
+)
+
+_help_mem_fill = (
+  ('<address/name> [len] <val>', 'fill memory with a 32-bit value'),
+  ('  address', 'address of memory (hex)'),
+  ('  name', 'name of memory region - see "map" command'),
+  ('  len', 'length of memory region (hex) - defaults to region size'),
+  ('  val', 'value (hex)'),
+)
+
+_help_mem_copy = (
+  ('<src> <dst> <len>', 'copy memory'),
+  ('  src', 'source address (hex) or region name'),
+  ('  dst', 'destination address (hex) or region name'),
+  ('  len', 'length of memory region (hex)'),
+)
+
+_help_mem_snap = (
+  ('<address/name> [len] <file>', 'take an incremental memory snapshot'),
+  ('  address', 'address of memory (hex)'),
+  ('  name', 'name of memory region - see "map" command'),
+  ('  len', 'length of memory region (hex) - defaults to region size'),
+  ('  file', 'snapshot file - only changed blocks are read if it exists'),
+)
+
+_help_mem_snapdiff = (
+  ('<file>', 'compare memory with a snapshot'),
+  ('  file', 'snapshot file - see "snap" command'),
+)
+
 _help_mem_rd = (
   ('<adr>', 'address (hex)'),
 )
@@ -95,6 +137,36 @@ def flash_regions(device, region_map):
     assert base_adr + total_size == adr, "regions don't encompass all memory"
   return regions
 
+# -----------------------------------------------------------------------------
+# memory snapshots
+# file format: header, per-block crc32s, zlib compressed memory image
+
+_snap_magic = b'pycssnap'
+_snap_hdr = '<8sLLLL'
+
+def snap_save(name, snap):
+  """save a (adr, block size, crcs, data) memory snapshot to a file"""
+  (adr, bsize, crcs, data) = snap
+  with open(name, 'wb') as f:
+    f.write(struct.pack(_snap_hdr, _snap_magic, adr, len(data), bsize, len(crcs)))
+    f.write(struct.pack('<%dL' % len(crcs), *crcs))
+    f.write(zlib.compress(data))
+
+def snap_load(name):
+  """load a memory snapshot from a file: return (adr, block size, crcs, data) or None"""
+  with open(name, 'rb') as f:
+    x = f.read()
+  k = struct.calcsize(_snap_hdr)
+  try:
+    (magic, adr, n, bsize, nblocks) = struct.unpack(_snap_hdr, x[:k])
+    crcs = list(struct.unpack('<%dL' % nblocks, x[k:k + (nblocks * 4)]))
+    data = zlib.decompress(x[k + (nblocks * 4):])
+  except (struct.error, zlib.error):
+    return None
+  if magic != _snap_magic or len(data) != n:
+    return None
+  return (adr, bsize, crcs, data)
+
 # -----------------------------------------------------------------------------
 
 class mem(object):
@@ -103,15 +175,21 @@ class mem(object):
     self.cpu = cpu
 
     self.menu = (
+      ('copy', self.cmd_copy, _help_mem_copy),
       ('d8', self.cmd_display8, _help_mem_region),
       ('d16', self.cmd_display16, _help_mem_region),
       ('d32', self.cmd_display32, _help_mem_region),
       ('>file', self.cmd_mem2file, _help_mem_2file),
+      ('fill', self.cmd_fill, _help_mem_fill),
+      ('find', self.cmd_find, _help_mem_find),
+      ('march', self.cmd_march, _help_mem_region),
       ('md5', self.cmd_md5, _help_mem_region),
       ('pic', self.cmd_pic, _help_mem_region),
       ('rd8', self.cmd_rd8, _help_mem_rd),
       ('rd16', self.cmd_rd16, _help_mem_rd),
       ('rd32', self.cmd_rd32, _help_mem_rd),
+      ('snap', self.cmd_snap, _help_mem_snap),
+      ('snapdiff', self.cmd_snapdiff, _help_mem_snapdiff),
       ('t8', self.cmd_test8, _help_mem_region),
       ('t16', self.cmd_test16, _help_mem_region),
       ('t32', self.cmd_test32, _help_mem_region),
@@ -176,6 +254,13 @@ class mem(object):
 
   def cmd_mem2file(self, ui, args):
     """read from memory, write to file"""
+    fmt = 'raw'
+    if args and args[-1].startswith('--'):
+      fmt = args[-1][2:]
+      if fmt not in iobuf.block_file.fmts:
+        ui.put(util.inv_arg)
+        return
+      args = args[:-1]
     x = util.file_mem_args(ui, args, self.cpu.device)
     if x is None:
       return
@@ -185,11 +270,32 @@ class mem(object):
       return
     # adjust the address and length
     adr = util.align(adr, 32)
-    n = util.nbytes_to_nwords(size, 32)
-    # read memory, write to file object
-    mf = iobuf.write_file(ui, 'writing to %s' % name, name, n * 4)
-    self.cpu.rdmem32(adr, n, mf)
-    mf.close()
+    n = util.nbytes_to_nwords(size, 32) * 4
+    try:
+      mf = iobuf.block_file(name, fmt)
+    except (IOError, OSError) as e:
+      ui.put('%s\n' % e)
+      return
+    # read memory blocks, the file is written by another thread
+    ui.put('writing to %s ' % name)
+    progress = util.progress(ui, 16, n)
+    t_start = time.time()
+    block_size = 64 << 10
+    data = iobuf.data_buffer(32)
+    for ofs in range(0, n, block_size):
+      k = min(n - ofs, block_size)
+      data.buf = []
+      data.wr_idx = 0
+      self.cpu.rdmem32(adr + ofs, k >> 2, data)
+      mf.put(adr + ofs, data.to_bytes('le'))
+      progress.update(ofs + k)
+    err = mf.close()
+    t = time.time() - t_start
+    progress.erase()
+    if err is not None:
+      ui.put('%s\n' % err)
+      return
+    ui.put('done (%.2f KiB/sec, %d bytes written)\n' % (float(n)/(t * 1024.0), mf.n))
 
   def cmd_verify(self, ui, args):
     """verify memory against file"""
@@ -240,11 +346,13 @@ class mem(object):
       ui.put('address   0        4        8        C\n')
     else:
       assert False, 'bad width'
-    # read and print the data
+    # read all of the data
+    data = self.cpu.rdbytes(adr, n)
+    # print the data
     for i in range(n >> 4):
-      # read 4, 32-bit words (16 bytes per line)
-      io = iobuf.data_buffer(32)
-      self.cpu.rdmem(adr, 4, io)
+      # 16 bytes per line
+      io = iobuf.data_buffer(8)
+      io.from_bytes(data[i << 4:(i + 1) << 4], 'le')
       # work out the data string
       io.convert(width, 'le')
       data_str = str(io)
@@ -266,22 +374,85 @@ class mem(object):
     """display memory 32 bits"""
     self.__display(ui, args, 32)
 
-  def __analyze(self, buf, ofs, n):
-    """return a character to respresent the buffer"""
-    b0 = buf[ofs]
-    if b0 is None:
-      c = ' '
-    elif b0 == 0:
-      c = '-'
-    elif b0 == 0xff:
-      c = '.'
-    else:
-      c = '$'
-    for i in range(1, n):
-      k = buf[ofs + i]
-      if k is not None and k != b0:
-        return '$'
-    return c
+  def __ramlib(self, lib, nbytes = 0):
+    """place a library routine and nbytes of workspace in the ram buffer
+    return (lib, workspace address, used region) or None
+    """
+    ram = self.cpu.device.rambuf
+    if ram is None:
+      return None
+    lib = cortexm.relocate_lib(lib, ram.adr)
+    code_size = cortexm.sizeof_lib(lib)
+    nbytes = min(util.roundup(nbytes, 32), (ram.size - code_size) & ~3)
+    return (lib, ram.adr + code_size, region(None, ram.adr, code_size + nbytes))
+
+  def __pic_host(self, adr, n, bps):
+    """classify memory blocks by reading all of the memory"""
+    data = iobuf.data_buffer(32)
+    self.cpu.rdmem32(adr, n >> 2, data)
+    data = data.to_bytes('le')
+    zeroes = bytes(bps)
+    ones = b'\xff' * bps
+    s = []
+    for ofs in range(0, n, bps):
+      blk = data[ofs:ofs + bps]
+      k = len(blk)
+      if blk == zeroes[:k]:
+        s.append('-')
+      elif blk == ones[:k]:
+        s.append('.')
+      else:
+        s.append('$')
+    return s
+
+  def __pic_target(self, adr, n, bps):
+    """classify memory blocks with a library routine - return None if not possible"""
+    nblocks = n // bps
+    # the results (1 byte per block) follow the code
+    x = self.__ramlib(cmlib.mem_classify, nblocks)
+    if x is None or bps & 3:
+      return None
+    (lib, res_adr, used) = x
+    res_max = used.end + 1 - res_adr
+    if used.overlap(region(None, adr, n)):
+      # we would overwrite the memory being classified
+      return None
+    ctx = self.cpu.save_context(used)
+    self.cpu.loadlib(lib)
+    symbols = ('-', '.', '$')
+    s = []
+    while nblocks > 0:
+      k = min(nblocks, res_max)
+      self.cpu.runlib(lib, (adr, k, bps, res_adr))
+      # read back the block classes
+      res = iobuf.data_buffer(32)
+      self.cpu.rdmem32(res_adr, util.nbytes_to_nwords(k, 32), res)
+      s.extend([symbols[x] for x in res.to_bytes('le')[:k]])
+      nblocks -= k
+      adr += k * bps
+    self.cpu.restore_context(ctx)
+    # classify any partial block on the host
+    if n % bps:
+      s.extend(self.__pic_host(adr, n % bps, bps))
+    return s
+
+  def __pic_mapped(self, adr, n, bps, bad):
+    """classify the readable memory blocks, unreadable blocks are 'x'"""
+    s = []
+    run = 0
+    for ofs in range(0, n, bps):
+      a = adr + ofs
+      k = min(bps, n - ofs)
+      if any([max(a, x[0]) < min(a + k, x[0] + x[1]) for x in bad]):
+        if run:
+          s.extend(self.__pic_host(a - run, run, bps))
+          run = 0
+        s.append('x')
+      else:
+        run += k
+    if run:
+      s.extend(self.__pic_host(adr + n - run, run, bps))
+    return s
 
   def cmd_pic(self, ui, args):
     """display a pictorial summary of memory"""
@@ -308,32 +479,30 @@ class mem(object):
     rows = int(math.ceil(n / (float(cols) * float(bps))))
     # bytes per row
     bpr = cols * bps
-    # work out the none padding
-    nwords = n >> 2
-    nwords_displayed = (((cols * rows * bps) + 3) & ~3) >> 2
-    none_pad = [None,] * ((nwords_displayed - nwords) * 4)
-    # read the memory
-    if n > (16 << 10):
-      ui.put('reading memory ...\n')
-    data = iobuf.data_buffer(32)
-    self.cpu.rdmem32(adr, nwords, data)
-    data.convert8(mode = 'le')
-    # add the none padding
-    data.buf.extend(none_pad)
+    # classify the memory blocks
+    s = None
+    bad = [(x[0], x[1]) for x in self.cpu.memmap.split(adr, n) if not x[2]]
+    if bad:
+      # skip the unreadable memory found by "map probe"
+      s = self.__pic_mapped(adr, n, bps, bad)
+    elif n > (16 << 10):
+      # large regions: only transfer the block classes from the target
+      s = self.__pic_target(adr, n, bps)
+      if s is None:
+        ui.put('reading memory ...\n')
+    if s is None:
+      s = self.__pic_host(adr, n, bps)
+    # pad the unused symbols
+    s.extend([' ',] * ((cols * rows) - len(s)))
     # display the summary
-    ui.put("'.' all ones, '-' all zeroes, '$' various\n")
+    ui.put("'.' all ones, '-' all zeroes, '$' various%s\n" % ("", ", 'x' unreadable")[len(bad) != 0])
     ui.put('%d (0x%x) bytes per symbol\n' % (bps, bps))
     ui.put('%d (0x%x) bytes per row\n' % (bpr, bpr))
     ui.put('%d cols x %d rows\n' % (cols, rows))
     # display the matrix
-    ofs = 0
     for y in range(rows):
-      s = []
-      adr_str = '0x%08x: ' % (adr + ofs)
-      for x in range(cols):
-        s.append(self.__analyze(data.buf, ofs, bps))
-        ofs += bps
-      ui.put('%s%s\n' % (adr_str, ''.join(s)))
+      adr_str = '0x%08x: ' % (adr + (y * bpr))
+      ui.put('%s%s\n' % (adr_str, ''.join(s[y * cols:(y + 1) * cols])))
 
   def cmd_md5(self, ui, args):
     """calculate an md5 hash of memory"""
@@ -359,6 +528,378 @@ class mem(object):
     ui.put('%s\n' % data.md5('le'))
     ui.put('%.2f KiB/sec\n' % (float(n)/((t_end - t_start) * 1024.0)))
 
+  def __host_fill(self, adr, n, val):
+    """fill n 32-bit words with val using host writes"""
+    chunk = 0x1000
+    while n > 0:
+      k = min(n, chunk)
+      self.cpu.wrmem32(adr, k, iobuf.data_buffer(32, (val,) * k))
+      adr += k * 4
+      n -= k
+
+  def __host_copy(self, src, dst, n):
+    """copy n 32-bit words from src to dst using host reads and writes"""
+    chunk = 0x1000
+    # copy downwards if the destination is above the source
+    ofs = list(range(0, n, chunk))
+    if dst > src:
+      ofs.reverse()
+    for i in ofs:
+      k = min(n - i, chunk)
+      data = iobuf.data_buffer(32)
+      self.cpu.rdmem32(src + (i * 4), k, data)
+      self.cpu.wrmem32(dst + (i * 4), k, data)
+
+  def __run_ramlib(self, lib, args, regions, host, sample = True):
+    """run a library routine, or the host function if we can't
+    return (target rate, host rate) in KiB/sec, None for an unmeasured rate
+    """
+    n = regions[0].size
+    x = self.__ramlib(lib)
+    if x is not None and any([x[2].overlap(r) for r in regions]):
+      # we would overwrite the library code
+      x = None
+    if x is None:
+      # do it all on the host
+      k = n
+    else:
+      # time the host operation on a sample of the memory
+      k = (0, min(n, 1 << 10))[sample]
+    host_rate = None
+    if k:
+      t_start = time.time()
+      host(k >> 2)
+      host_rate = float(k)/((time.time() - t_start) * 1024.0)
+    if x is None:
+      return (None, host_rate)
+    (lib, _, used) = x
+    ctx = self.cpu.save_context(used)
+    t_start = time.time()
+    self.cpu.loadlib(lib)
+    self.cpu.runlib(lib, args)
+    t_lib = time.time() - t_start
+    self.cpu.restore_context(ctx)
+    return (float(n)/(t_lib * 1024.0), host_rate)
+
+  def __rate_str(self, rates):
+    """return a string for the target/host transfer rates"""
+    s = []
+    for (name, rate) in zip(('target', 'host'), rates):
+      if rate is not None:
+        s.append('%s %.2f KiB/sec' % (name, rate))
+    return ', '.join(s)
+
+  def cmd_fill(self, ui, args):
+    """fill memory with a value"""
+    if util.wrong_argc(ui, args, (2, 3)):
+      return
+    val = util.int_arg(ui, args[-1], util.limit_32, 16)
+    if val is None:
+      return
+    x = util.mem_args(ui, args[:-1], self.cpu.device)
+    if x is None:
+      return
+    (adr, n) = x
+    if n is None:
+      ui.put('invalid length\n')
+      return
+    # round down address to 32-bit byte boundary
+    adr &= ~3
+    # round up n to an integral multiple of 4 bytes
+    n = (n + 3) & ~3
+    r = region(None, adr, n)
+    rates = self.__run_ramlib(cmlib.mem_fill, (adr, val, n >> 2), (r,), lambda k: self.__host_fill(adr, k, val))
+    ui.put('fill 0x%08x-0x%08x with 0x%08x: %s\n' % (r.adr, r.end, val, self.__rate_str(rates)))
+
+  def cmd_copy(self, ui, args):
+    """copy memory"""
+    if util.wrong_argc(ui, args, (3,)):
+      return
+    x = util.mem_args(ui, args[0:1], self.cpu.device)
+    if x is None:
+      return
+    src = x[0]
+    x = util.mem_args(ui, args[1:2], self.cpu.device)
+    if x is None:
+      return
+    dst = x[0]
+    n = util.int_arg(ui, args[2], (1, 0xffffffff), 16)
+    if n is None:
+      return
+    if (src | dst) & 3:
+      ui.put('addresses must be 32-bit aligned\n')
+      return
+    # round up n to an integral multiple of 4 bytes
+    n = (n + 3) & ~3
+    regions = (region(None, src, n), region(None, dst, n))
+    # a partial host copy of overlapping regions would corrupt the source
+    sample = not regions[0].overlap(regions[1])
+    rates = self.__run_ramlib(cmlib.mem_copy, (src, dst, n >> 2), regions, lambda k: self.__host_copy(src, dst, k), sample)
+    ui.put('copy 0x%08x > 0x%08x (%d bytes): %s\n' % (src, dst, n, self.__rate_str(rates)))
+
+  def __find_args(self, ui, args):
+    """find arguments: return (adr, n, pattern, align) or None"""
+    args = list(args)
+    align = 1
+    if len(args) >= 2 and args[-2] == '--align':
+      align = util.int_arg(ui, args[-1], (1, 0x10000), 16)
+      if align is None:
+        return None
+      args = args[:-2]
+    # a quoted string may contain spaces, so it can span arguments
+    quoted = [i for (i, x) in enumerate(args) if x.startswith('"')]
+    if quoted:
+      i = quoted[0]
+      s = ' '.join(args[i:])
+      if len(s) < 3 or not s.endswith('"'):
+        ui.put(util.inv_arg)
+        return None
+      pattern = s[1:-1].encode('latin-1')
+      args = args[:i]
+    elif len(args) >= 2:
+      try:
+        pattern = bytes.fromhex(args[-1])
+      except ValueError:
+        ui.put(util.inv_arg)
+        return None
+      args = args[:-1]
+    else:
+      ui.put(util.bad_argc)
+      return None
+    if len(pattern) == 0:
+      ui.put(util.inv_arg)
+      return None
+    x = util.mem_args(ui, args, self.cpu.device)
+    if x is None:
+      return None
+    (adr, n) = x
+    if n is None:
+      ui.put('invalid length\n')
+      return None
+    return (adr, n, pattern, align)
+
+  def cmd_find(self, ui, args):
+    """find a byte pattern in memory"""
+    x = self.__find_args(ui, args)
+    if x is None:
+      return
+    (start, size, pattern, align) = x
+    # read 32-bit aligned blocks
+    adr = start & ~3
+    n = (start + size - adr + 3) & ~3
+    block_size = 64 << 10
+    # keep the tail of the previous block to find matches that span blocks
+    keep = len(pattern) - 1
+    matches = []
+    prev = b''
+    t_start = time.time()
+    while n > 0:
+      k = min(n, block_size)
+      data = iobuf.data_buffer(32)
+      self.cpu.rdmem32(adr, k >> 2, data)
+      buf = prev + data.to_bytes('le')
+      buf_adr = adr - len(prev)
+      i = buf.find(pattern)
+      while i >= 0:
+        match_adr = buf_adr + i
+        if match_adr >= start and match_adr + len(pattern) <= start + size and match_adr % align == 0:
+          matches.append(match_adr)
+        i = buf.find(pattern, i + 1)
+      # the tail is shorter than the pattern, so no match is reported twice
+      prev = (b'', buf[len(buf) - keep:])[keep > 0]
+      adr += k
+      n -= k
+    t_end = time.time()
+    # display the matches
+    nmax = 64
+    for x in matches[:nmax]:
+      p = self.cpu.device.lookup(x)
+      name = ' %s+0x%x' % (p.name, x - p.address) if p is not None else ''
+      ui.put('0x%08x%s\n' % (x, name))
+    if len(matches) > nmax:
+      ui.put('... %d more\n' % (len(matches) - nmax))
+    ui.put('%d matches (%.2f KiB/sec)\n' % (len(matches), float(size)/((t_end - t_start) * 1024.0)))
+
+  def __snap_bsize(self, n):
+    """return a snapshot block size for n bytes of memory"""
+    bsize = 1 << 10
+    ram = self.cpu.device.rambuf
+    if ram is not None:
+      # the crc table and the block crcs should fit in the ram buffer
+      avail = ram.size - cortexm.sizeof_lib(cmlib.mem_crc32) - 1024
+      while (n // bsize) * 4 > avail:
+        bsize *= 2
+    return bsize
+
+  def __snap_read(self, adr, n, bsize, old = None):
+    """
+    read memory for a snapshot
+    old = (crcs, data) of a previous snapshot, only changed blocks are read
+    return (crcs, data, bytes transferred)
+    """
+    nblocks = (n + bsize - 1) // bsize
+    # whole blocks have their crcs calculated on the target
+    k = n // bsize
+    x = None
+    if old is not None and k > 0:
+      x = self.__ramlib(cmlib.mem_crc32, 1024 + (k * 4))
+      if x is not None and x[2].end + 1 - x[1] < 1024 + (k * 4):
+        # not enough workspace
+        x = None
+    if x is None:
+      # read all of the memory
+      data = iobuf.data_buffer(32)
+      self.cpu.rdmem32(adr, n >> 2, data)
+      data = data.to_bytes('le')
+      crcs = [zlib.crc32(data[i:i + bsize]) for i in range(0, n, bsize)]
+      return (crcs, data, n)
+    (lib, ws, used) = x
+    ctx = self.cpu.save_context(used)
+    saved = ctx[3].to_bytes('le')
+    xfer = (used.size * 2) + cortexm.sizeof_lib(lib)
+
+    def rd(a, size):
+      """read memory as it was before the library was loaded"""
+      buf = iobuf.data_buffer(32)
+      self.cpu.rdmem32(a, size >> 2, buf)
+      buf = bytearray(buf.to_bytes('le'))
+      lo = max(a, used.adr)
+      hi = min(a + size, used.end + 1)
+      if lo < hi:
+        buf[lo - a:hi - a] = saved[lo - used.adr:hi - used.adr]
+      return bytes(buf)
+
+    self.cpu.loadlib(lib)
+    self.cpu.runlib(lib, (adr, k, bsize, ws))
+    res = iobuf.data_buffer(32)
+    self.cpu.rdmem32(ws + 1024, k, res)
+    crcs = res.buf
+    xfer += k * 4
+    # the crcs of blocks in the scratch ram (and any partial block) are done on the host
+    (old_crcs, old_data) = old
+    data = bytearray(old_data)
+    on_host = []
+    for i in range(nblocks):
+      r = region(None, adr + (i * bsize), min(bsize, n - (i * bsize)))
+      if i >= k or r.overlap(used):
+        blk = rd(r.adr, r.size)
+        data[i * bsize:(i * bsize) + r.size] = blk
+        crc = zlib.crc32(blk)
+        if i < k:
+          crcs[i] = crc
+        else:
+          crcs.append(crc)
+        on_host.append(i)
+        xfer += r.size
+    # read the runs of changed blocks
+    i = 0
+    while i < nblocks:
+      if crcs[i] == old_crcs[i] or i in on_host:
+        i += 1
+        continue
+      j = i
+      while j < nblocks and crcs[j] != old_crcs[j] and j not in on_host:
+        j += 1
+      a = i * bsize
+      size = min(j * bsize, n) - a
+      data[a:a + size] = rd(adr + a, size)
+      xfer += size
+      i = j
+    self.cpu.restore_context(ctx)
+    return (crcs, bytes(data), xfer)
+
+  def __snap_stats(self, ui, n, xfer, nchanged, nblocks, t):
+    """display the snapshot transfer statistics"""
+    saved = 100.0 * (1.0 - (float(xfer) / float(n)))
+    ui.put('%d of %d blocks changed\n' % (nchanged, nblocks))
+    ui.put('%d of %d bytes transferred (%.1f%% saved), %.2f KiB/sec\n' % (xfer, n, saved, float(n)/(t * 1024.0)))
+
+  def __snap_file(self, ui, name):
+    """load a snapshot file: return the snapshot or None"""
+    try:
+      snap = snap_load(name)
+    except (IOError, OSError) as e:
+      ui.put('%s\n' % e)
+      return None
+    if snap is None:
+      ui.put('%s is not a snapshot file\n' % name)
+    return snap
+
+  def cmd_snap(self, ui, args):
+    """take an incremental memory snapshot"""
+    if util.wrong_argc(ui, args, (2, 3)):
+      return
+    name = args[-1]
+    x = util.mem_args(ui, args[:-1], self.cpu.device)
+    if x is None:
+      return
+    (adr, n) = x
+    if n is None:
+      ui.put('invalid length\n')
+      return
+    # round down address to 32-bit byte boundary
+    adr &= ~3
+    # round up n to an integral multiple of 4 bytes
+    n = (n + 3) & ~3
+    old = None
+    if os.path.exists(name):
+      old = self.__snap_file(ui, name)
+      if old is None:
+        return
+      if old[0] != adr or len(old[3]) != n:
+        # a different memory region: start again
+        old = None
+    if old is None:
+      bsize = self.__snap_bsize(n)
+    else:
+      (bsize, old_crcs, old_data) = old[1:]
+      old = (old_crcs, old_data)
+    t_start = time.time()
+    (crcs, data, xfer) = self.__snap_read(adr, n, bsize, old)
+    t = time.time() - t_start
+    try:
+      snap_save(name, (adr, bsize, crcs, data))
+    except (IOError, OSError) as e:
+      ui.put('%s\n' % e)
+      return
+    ui.put('snapshot 0x%08x-0x%08x (%d byte blocks) saved to %s\n' % (adr, adr + n - 1, bsize, name))
+    nchanged = len(crcs)
+    if old is not None:
+      nchanged = len([i for i in range(len(crcs)) if crcs[i] != old_crcs[i]])
+    self.__snap_stats(ui, n, xfer, nchanged, len(crcs), t)
+
+  def cmd_snapdiff(self, ui, args):
+    """compare memory with a snapshot"""
+    if util.wrong_argc(ui, args, (1,)):
+      return
+    old = self.__snap_file(ui, args[0])
+    if old is None:
+      return
+    (adr, bsize, old_crcs, old_data) = old
+    n = len(old_data)
+    t_start = time.time()
+    (crcs, data, xfer) = self.__snap_read(adr, n, bsize, (old_crcs, old_data))
+    t = time.time() - t_start
+    # display the runs of changed words
+    diffs = []
+    for i in [i for i in range(len(crcs)) if crcs[i] != old_crcs[i]]:
+      for ofs in range(i * bsize, min((i + 1) * bsize, n), 4):
+        if data[ofs:ofs + 4] != old_data[ofs:ofs + 4]:
+          if diffs and diffs[-1][1] == ofs:
+            diffs[-1][1] = ofs + 4
+          else:
+            diffs.append([ofs, ofs + 4])
+    nmax = 64
+    for (start, end) in diffs[:nmax]:
+      a = adr + start
+      p = self.cpu.device.lookup(a)
+      name = ' %s+0x%x' % (p.name, a - p.address) if p is not None else ''
+      ui.put('0x%08x-0x%08x (%d bytes)%s\n' % (a, adr + end - 1, end - start, name))
+    if len(diffs) > nmax:
+      ui.put('... %d more\n' % (len(diffs) - nmax))
+    nchanged = len([i for i in range(len(crcs)) if crcs[i] != old_crcs[i]])
+    self.__snap_stats(ui, n, xfer, nchanged, len(crcs), t)
+
   def cmd_test(self, width, ui, args):
     """test memory with a write and readback"""
     x = util.mem_args(ui, args, self.cpu.device)
@@ -375,12 +916,11 @@ class mem(object):
     n = (n + 3) & ~3
     # convert to n 32/16/8-bit units
     nx = int(n / (width >> 3))
-    maxval = (1 << width) - 1
     # we will typically be testing ram, so halt the cpu.
     self.cpu.halt()
     # build a random write buffer
     wrbuf = iobuf.data_buffer(width)
-    [wrbuf.write(random.randint(0, maxval)) for i in range(nx)]
+    wrbuf.from_bytes(os.urandom(n), 'le')
     # write it to memory
     t_start = time.time()
     self.cpu.wrmem(adr, nx, wrbuf)
@@ -394,6 +934,46 @@ class mem(object):
     ui.put('read %.2f KiB/sec\n' % (float(n)/((t_end - t_start) * 1024.0)))
     ui.put('read %s write\n' % ('!=', '==')[wrbuf.compare(rdbuf)])
 
+  def cmd_march(self, ui, args):
+    """test memory with an on-target march C- test"""
+    x = util.mem_args(ui, args, self.cpu.device)
+    if x is None:
+      return
+    (adr, n) = x
+    if n == 0:
+      return
+    if n is None:
+      n = 0x40
+    # round down address to 32-bit byte boundary
+    adr &= ~3
+    # round up n to an integral multiple of 4 bytes
+    n = (n + 3) & ~3
+    # the fault addresses follow the code
+    nfaults_max = 16
+    x = self.__ramlib(cmlib.mem_march, nfaults_max * 4)
+    if x is None:
+      ui.put('no ram buffer for the test routine\n')
+      return
+    (lib, faults_adr, used) = x
+    if used.overlap(region(None, adr, n)):
+      ui.put('memory region overlaps the test routine at 0x%08x-0x%08x\n' % (used.adr, used.end))
+      return
+    # we will typically be testing ram, so halt the cpu.
+    self.cpu.halt()
+    ctx = self.cpu.save_context(used)
+    self.cpu.loadlib(lib)
+    t_start = time.time()
+    nfaults = self.cpu.runlib(lib, (adr, n >> 2, faults_adr, nfaults_max))
+    t_end = time.time()
+    faults = iobuf.data_buffer(32)
+    self.cpu.rdmem32(faults_adr, min(nfaults, nfaults_max), faults)
+    self.cpu.restore_context(ctx)
+    # report the results
+    ui.put('march C- %.2f KiB/sec\n' % (float(n)/((t_end - t_start) * 1024.0)))
+    ui.put('%d faults\n' % nfaults)
+    for x in faults.buf:
+      ui.put('fault at 0x%08x\n' % x)
+
   def cmd_test8(self, ui, args):
     """test memory with 8-bit write and readback"""
     self.cmd_test(8, ui, args)
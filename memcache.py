@@ -0,0 +1,201 @@
+#-----------------------------------------------------------------------------
+"""
+
+Memory Read Cache
+
+Hold host copies of the expected content of immutable memory (flash).
+Images are validated against the target when they are added and after
+programming, with an on-target CRC32 when there is a ram buffer and by
+sampled readback otherwise. Reads that fall entirely within a valid image
+are then served from the host copy. Flash erase/write operations invalidate
+the images they overlap. The read path doesn't halt or run code on the
+target, so it only does a sampled readback of an unvalidated image.
+
+"""
+#-----------------------------------------------------------------------------
+
+import zlib
+
+import util
+import iobuf
+import cortexm
+import cmlib
+import mem
+
+#-----------------------------------------------------------------------------
+
+# sampled readback: number of samples and bytes per sample
+_nsamples = 32
+_sample_size = 32
+
+#-----------------------------------------------------------------------------
+
+class image(object):
+  """expected memory content"""
+
+  def __init__(self, name, adr, data):
+    self.name = name
+    self.adr = adr
+    self.data = data
+    self.end = adr + len(data) - 1
+    self.valid = False
+    # number of reads served from the cache
+    self.hits = 0
+
+  def overlap(self, adr, end):
+    """return True if the image overlaps adr..end"""
+    return max(self.adr, adr) <= min(self.end, end)
+
+  def __str__(self):
+    state = ('unvalidated', 'valid')[self.valid]
+    return '%s: %08x %08x %s (%d hits)' % (self.name, self.adr, self.end, state, self.hits)
+
+#-----------------------------------------------------------------------------
+
+class memcache(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.images = []
+
+  def add(self, name, adr, data):
+    """add an image of the expected memory content"""
+    x = image(name, adr, data)
+    # replace overlapping images
+    self.images = [i for i in self.images if not i.overlap(x.adr, x.end)]
+    self.images.append(x)
+    return x
+
+  def clear(self):
+    """remove all images"""
+    self.images = []
+
+  def invalidate(self, adr = None, n = None):
+    """the memory adr..adr+n-1 (or all memory) has changed: revalidate overlapping images"""
+    for i in self.images:
+      if adr is None or i.overlap(adr, adr + n - 1):
+        i.valid = False
+
+  def rd_crc32s(self, ranges):
+    """return the crc32s of the (adr, n) memory ranges computed on the target, or None"""
+    ram = self.cpu.device.rambuf
+    if ram is None or not ranges:
+      return None
+    lib = cortexm.relocate_lib(cmlib.mem_crc32, ram.adr)
+    code_size = cortexm.sizeof_lib(lib)
+    ws = ram.adr + code_size
+    # 1 KiB table + 4 bytes per block
+    max_blocks = (ram.size - code_size - 1024) >> 2
+    # contiguous ranges of the same size are done as the blocks of one run
+    runs = []
+    for (adr, n) in ranges:
+      x = runs and runs[-1]
+      if x and x[2] == n and x[0] + (x[1] * n) == adr and x[1] < max_blocks:
+        x[1] += 1
+      else:
+        runs.append([adr, 1, n])
+    nblocks = max([x[1] for x in runs])
+    used = mem.region(None, ram.adr, code_size + 1024 + (4 * nblocks))
+    ctx = self.cpu.save_context(used)
+    self.cpu.loadlib(lib)
+    crcs = []
+    for (adr, k, n) in runs:
+      self.cpu.runlib(lib, (adr, k, n, ws))
+      io = iobuf.data_buffer(32)
+      self.cpu.dbgio.rdmem32(ws + 1024, k, io)
+      crcs.extend(io.buf)
+    self.cpu.restore_context(ctx)
+    return crcs
+
+  def rd_crc32(self, adr, n):
+    """return the crc32 of the memory computed on the target, or None"""
+    x = self.rd_crc32s(((adr, n),))
+    if x is None:
+      return None
+    return x[0]
+
+  def rd_blank(self, ranges):
+    """return True for each (adr, n) memory range that is all ones (erased flash), or None"""
+    ram = self.cpu.device.rambuf
+    if ram is None or not ranges:
+      return None
+    lib = cortexm.relocate_lib(cmlib.mem_classify, ram.adr)
+    code_size = cortexm.sizeof_lib(lib)
+    ws = ram.adr + code_size
+    # 1 byte per block
+    max_blocks = ram.size - code_size
+    # contiguous ranges of the same size are done as the blocks of one run
+    runs = []
+    for (adr, n) in ranges:
+      x = runs and runs[-1]
+      if x and x[2] == n and x[0] + (x[1] * n) == adr and x[1] < max_blocks:
+        x[1] += 1
+      else:
+        runs.append([adr, 1, n])
+    nblocks = max([x[1] for x in runs])
+    used = mem.region(None, ram.adr, code_size + util.roundup(nblocks, 32))
+    ctx = self.cpu.save_context(used)
+    self.cpu.loadlib(lib)
+    blank = []
+    for (adr, k, n) in runs:
+      self.cpu.runlib(lib, (adr, k, n, ws))
+      io = iobuf.data_buffer(32)
+      self.cpu.dbgio.rdmem32(ws, (k + 3) >> 2, io)
+      # block class 1 = all ones
+      blank.extend([x == 1 for x in io.to_bytes('le')[:k]])
+    self.cpu.restore_context(ctx)
+    return blank
+
+  def sampled_match(self, x):
+    """compare samples of an image with the target memory"""
+    n = len(x.data)
+    step = max(n // _nsamples, _sample_size)
+    for ofs in list(range(0, n, step)) + [max(n - _sample_size, 0),]:
+      ofs &= ~3
+      k = min(_sample_size, n - ofs) >> 2
+      io = iobuf.data_buffer(32)
+      self.cpu.dbgio.rdmem32(x.adr + ofs, k, io)
+      if io.to_bytes('le') != x.data[ofs:ofs + (k * 4)]:
+        return False
+    return True
+
+  def validate(self, x):
+    """validate an image against the target: return True if it matches"""
+    crc = self.rd_crc32(x.adr, len(x.data))
+    if crc is not None:
+      x.valid = crc == zlib.crc32(x.data)
+    else:
+      x.valid = self.sampled_match(x)
+    return x.valid
+
+  def revalidate(self, ui):
+    """validate the invalidated images: remove the ones that don't match"""
+    for x in [i for i in self.images if not i.valid]:
+      if not self.validate(x):
+        ui.put('cache: %s does not match the target, removed\n' % x.name)
+        self.images.remove(x)
+
+  def rd(self, adr, n):
+    """return n bytes of cached memory at adr, or None"""
+    if n <= 0:
+      return None
+    for x in self.images:
+      if x.adr <= adr and adr + n - 1 <= x.end:
+        if not x.valid:
+          # passive read: no halting or code on the target
+          x.valid = self.sampled_match(x)
+        if not x.valid:
+          self.cpu.ui.put('cache: %s does not match the target, removed\n' % x.name)
+          self.images.remove(x)
+          return None
+        x.hits += 1
+        ofs = adr - x.adr
+        return x.data[ofs:ofs + n]
+    return None
+
+  def __str__(self):
+    if not self.images:
+      return 'no cached images'
+    return '\n'.join([str(x) for x in self.images])
+
+#-----------------------------------------------------------------------------
@@ -0,0 +1,180 @@
+#-----------------------------------------------------------------------------
+"""
+
+Accessible Memory Map
+
+Find the readable address ranges of a device by block reads of each
+peripheral and memory region. A faulting block is bisected to find its
+readable sub-ranges. The map is cached per device (name and CPUID) and
+is used by bulk commands to skip unreadable memory.
+
+"""
+#-----------------------------------------------------------------------------
+
+import json
+import time
+
+import util
+
+#-----------------------------------------------------------------------------
+
+# memory regions are probed in blocks of this size
+_block_size = 16 << 10
+
+# bisection stops at this fraction of a block
+_bisect_shift = 6
+
+CPUID = 0xE000ED00
+
+#-----------------------------------------------------------------------------
+
+def merge(ranges):
+  """merge adjacent/overlapping (adr, size) ranges"""
+  out = []
+  for (adr, size) in sorted(ranges):
+    if out and adr <= out[-1][0] + out[-1][1]:
+      end = max(out[-1][0] + out[-1][1], adr + size)
+      out[-1] = (out[-1][0], end - out[-1][0])
+    else:
+      out.append((adr, size))
+  return out
+
+#-----------------------------------------------------------------------------
+
+class memmap(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.device = cpu.device
+    # probed and readable (adr, size) ranges, None until probed or loaded
+    self.probed = None
+    self.readable = None
+    self.loaded = False
+    self.nreads = 0
+
+  def device_id(self):
+    """return a string identifying the device"""
+    return '%s_%08x' % (self.device.name, self.cpu.dbgio.rd32(CPUID))
+
+  def cache_name(self):
+    return util.cache_file('map_%s.json' % self.device_id())
+
+  def load(self):
+    """load a cached map for this device"""
+    self.loaded = True
+    try:
+      with open(self.cache_name()) as f:
+        x = json.load(f)
+    except (IOError, OSError, ValueError):
+      return
+    self.probed = [tuple(r) for r in x['probed']]
+    self.readable = [tuple(r) for r in x['readable']]
+
+  def save(self):
+    """save the map for this device"""
+    with open(self.cache_name(), 'w') as f:
+      json.dump({'probed': self.probed, 'readable': self.readable}, f)
+
+  def probe_rd(self, adr, size):
+    """return True if the memory can be read"""
+    self.nreads += 1
+    return self.cpu.dbgio.probe_rd32(adr, size >> 2)
+
+  def bisect(self, adr, size, minsize):
+    """return the readable (adr, size) sub-ranges of a memory range"""
+    if self.probe_rd(adr, size):
+      return [(adr, size)]
+    if size <= minsize:
+      return []
+    half = util.roundup(size >> 1, 32)
+    return self.bisect(adr, half, minsize) + self.bisect(adr + half, size - half, minsize)
+
+  def probe_region(self, adr, size):
+    """return the readable (adr, size) sub-ranges of a peripheral/memory region"""
+    block = min(size, _block_size)
+    minsize = max(4, util.roundup(block >> _bisect_shift, 32))
+    readable = []
+    for ofs in range(0, size, block):
+      readable.extend(self.bisect(adr + ofs, min(block, size - ofs), minsize))
+    return readable
+
+  def probe(self, ui):
+    """probe the device peripherals and memory regions"""
+    running = self.cpu.dbgio.is_running()
+    self.cpu.halt()
+    # check that the debug probe can detect read faults
+    plist = [p for p in self.device.peripheral_list() if p.size]
+    if plist and self.cpu.dbgio.probe_rd32(util.align(plist[0].address, 32), 1) is None:
+      ui.put('memory probing is not supported by this debug probe\n')
+      if running:
+        self.cpu.go()
+      return
+    self.probed = []
+    self.readable = []
+    self.nreads = 0
+    nfaults = 0
+    t_start = time.time()
+    for p in plist:
+      adr = util.align(p.address, 32)
+      size = util.roundup(p.address + p.size - adr, 32)
+      readable = self.probe_region(adr, size)
+      self.probed.append((adr, size))
+      self.readable.extend(readable)
+      nbytes = sum([x[1] for x in readable])
+      if nbytes != size:
+        nfaults += 1
+        ui.put('%s: %s of %s readable\n' % (p.name, util.memsize(nbytes), util.memsize(size)))
+    t = time.time() - t_start
+    if running:
+      self.cpu.go()
+    self.probed = merge(self.probed)
+    self.readable = merge(self.readable)
+    self.loaded = True
+    ui.put('%d regions not fully readable, %d reads in %.2f secs\n' % (nfaults, self.nreads, t))
+    try:
+      self.save()
+    except (IOError, OSError) as e:
+      ui.put('%s\n' % e)
+
+  def split(self, adr, n):
+    """split adr..adr+n-1 into (adr, size, readable) ranges - unprobed memory is readable"""
+    if not self.loaded:
+      self.load()
+    if not self.probed:
+      return [(adr, n, True)]
+    end = adr + n
+    # the unreadable parts of the probed ranges
+    bad = []
+    for (a, size) in self.probed:
+      lo = max(a, adr)
+      hi = min(a + size, end)
+      while lo < hi:
+        # find the next readable range
+        x = [r for r in self.readable if r[0] + r[1] > lo and r[0] < hi]
+        if not x:
+          bad.append((lo, hi - lo))
+          break
+        r = min(x)
+        if r[0] > lo:
+          bad.append((lo, r[0] - lo))
+        lo = r[0] + r[1]
+    out = []
+    for (a, size) in merge(bad):
+      if a > adr:
+        out.append((adr, a - adr, True))
+      out.append((a, size, False))
+      adr = a + size
+    if adr < end:
+      out.append((adr, end - adr, True))
+    return out
+
+  def is_readable(self, adr, n):
+    """return True if adr..adr+n-1 is (or may be) readable"""
+    return all([x[2] for x in self.split(adr, n)])
+
+  def __str__(self):
+    if not self.probed:
+      return 'no memory map (run "map probe")'
+    return '\n'.join(['%08x %08x %s' % (a, a + size - 1, util.memsize(size)) for (a, size) in self.readable])
+
+#-----------------------------------------------------------------------------
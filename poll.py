@@ -0,0 +1,110 @@
+#-----------------------------------------------------------------------------
+"""
+
+Adaptive Polling
+
+Wait for the completion of a hardware operation (E.g. a flash erase/write)
+by polling a status register. The register is read back to back for a short
+spin window, so fast operations complete with little latency. After that
+the poller sleeps through most of the expected duration of the operation
+and then backs off exponentially.
+
+The expected durations are per operation tables provided by the driver:
+
+{operation: (secs per operation, secs per byte)}
+
+The observed durations are recorded so the tables can be tuned.
+
+"""
+#-----------------------------------------------------------------------------
+
+import time
+
+#-----------------------------------------------------------------------------
+
+# back to back reads for this long (secs)
+_spin_time = 0.002
+# sleep time limits (secs)
+_sleep_min = 0.0005
+_sleep_max = 0.1
+# minimum timeout (secs) and timeout as a multiple of the expected (typical) duration
+_timeout = 1.0
+_timeout_scale = 10
+
+#-----------------------------------------------------------------------------
+
+def ms_str(t):
+  """return a string for a time in secs"""
+  return '%.1fms' % (t * 1000.0)
+
+class observed(object):
+  """observed durations of an operation"""
+
+  def __init__(self):
+    self.n = 0
+    self.total = 0.0
+    self.tmin = None
+    self.tmax = 0.0
+    # total expected duration
+    self.expected = 0.0
+
+  def add(self, t, t_exp):
+    self.n += 1
+    self.expected += t_exp
+    self.total += t
+    self.tmin = t if self.tmin is None else min(self.tmin, t)
+    self.tmax = max(self.tmax, t)
+
+#-----------------------------------------------------------------------------
+
+class poller(object):
+  """poll for the completion of hardware operations"""
+
+  def __init__(self, times, timeout = _timeout):
+    self.times = times
+    self.timeout = timeout
+    # observed durations per operation
+    self.ops = {}
+    self.ntimeouts = 0
+
+  def expected(self, op, nbytes = 0):
+    """return the expected duration (secs) of an operation"""
+    (t, tb) = self.times.get(op, (0, 0))
+    return t + tb * nbytes
+
+  def wait(self, op, rd, done, nbytes = 0):
+    """poll rd() until done(value): return (value, elapsed secs), elapsed is None for a timeout"""
+    t_exp = self.expected(op, nbytes)
+    timeout = max(self.timeout, _timeout_scale * t_exp)
+    delay = None
+    t_start = time.time()
+    while True:
+      val = rd()
+      t = time.time() - t_start
+      if done(val):
+        self.ops.setdefault(op, observed()).add(t, t_exp)
+        return (val, t)
+      if t >= timeout:
+        self.ntimeouts += 1
+        return (val, None)
+      if t < _spin_time:
+        continue
+      if delay is None:
+        # back off from a fraction of the expected duration
+        delay = max(_sleep_min, t_exp / 16.0)
+        if t < 0.75 * t_exp:
+          # sleep through most of the expected duration
+          time.sleep(0.75 * t_exp - t)
+          continue
+      time.sleep(min(delay, timeout - t))
+      delay = min(2 * delay, max(_sleep_max, delay))
+
+  def __str__(self):
+    s = ['%-8s %6s %10s %10s %10s %10s' % ('op', 'n', 'expected', 'min', 'mean', 'max')]
+    for op in sorted(self.ops):
+      x = self.ops[op]
+      s.append('%-8s %6d %10s %10s %10s %10s' % (op, x.n, ms_str(x.expected / x.n), ms_str(x.tmin), ms_str(x.total / x.n), ms_str(x.tmax)))
+    s.append('%d timeouts' % self.ntimeouts)
+    return '\n'.join(s)
+
+#-----------------------------------------------------------------------------
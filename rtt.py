@@ -11,11 +11,27 @@ This code finds the buffers in RAM and then reads them as the target code runs.
 
 import util
 import iobuf
+import cstruct
 
 #-----------------------------------------------------------------------------
 
-sizeof_SEGGER_RTT_CB_header = 24
-sizeof_SEGGER_RTT_RING_BUFFER = 24
+SEGGER_RTT_CB_header = cstruct.layout('SEGGER_RTT_CB', (
+  ('id', 0, 'char', 16),
+  ('max_up', 16, 'i32'),
+  ('max_down', 20, 'i32'),
+))
+
+SEGGER_RTT_RING_BUFFER = cstruct.layout('SEGGER_RTT_BUFFER', (
+  ('name', 0, 'u32'),
+  ('buf', 4, 'u32'),
+  ('size', 8, 'u32'),
+  ('wr_ofs', 12, 'u32'),
+  ('rd_ofs', 16, 'u32'),
+  ('flags', 20, 'u32'),
+))
+
+# limit the number of 16 byte reads for a buffer name
+_name_max = 8
 
 _not_initialised = 'rtt is not initialised'
 
@@ -24,52 +40,56 @@ _not_initialised = 'rtt is not initialised'
 class rtt_buf(object):
   """rtt buffer object"""
 
-  def __init__(self, cpu, adr):
+  def __init__(self, cpu, x):
     self.cpu = cpu
-    self.adr = adr
-    # get the name
-    self.name = self.get_name(self.cpu.rd(self.adr, 32))
-    # get the buffer address
-    self.buf_adr = self.cpu.rd(self.adr + 4, 32)
-    # get the buffer size
-    self.buf_size = self.cpu.rd(self.adr + 8, 32)
-    # get the flags
-    self.flags = self.cpu.rd(self.adr + 20, 32)
-    # record the other addresses for future reference
-    self.wr_ofs_adr = self.adr + 12
-    self.rd_ofs_adr = self.adr + 16
+    self.adr = x._adr
+    self.name = self.get_name(x.name)
+    self.buf_adr = x.buf
+    self.buf_size = x.size
+    self.flags = x.flags
+    # record the read offset address for future reference
+    self.rd_ofs_adr = x.field_adr('rd_ofs')
+
+  def get_ofs(self):
+    """return the (write, read) offsets"""
+    x = SEGGER_RTT_RING_BUFFER.rd(self.cpu, self.adr)
+    return (x.wr_ofs, x.rd_ofs)
 
   def get_name(self, adr):
     """read and return the buffer name"""
     if adr == 0:
       return ''
     s = []
-    while True:
-      c = self.cpu.rd(adr, 8)
-      if c == 0:
+    while len(s) < _name_max:
+      # read up to the next 16 byte boundary
+      x = self.cpu.rdbytes(adr, 16 - (adr & 15))
+      i = x.find(b'\0')
+      if i >= 0:
+        s.append(x[:i])
         break
-      adr += 1
-      s.append(chr(c))
-    return ''.join(s)
+      s.append(x)
+      adr += len(x)
+    return b''.join(s).decode('latin-1')
+
+  def rd_data(self, rd_ofs, wr_ofs):
+    """read the buffer data between the read and write offsets"""
+    if rd_ofs < wr_ofs:
+      # non-wrapped buffer: read to write offset
+      return self.cpu.rdbytes(self.buf_adr + rd_ofs, wr_ofs - rd_ofs)
+    # wrapped buffer: read to end of buffer, then to write offset
+    x = self.cpu.rdbytes(self.buf_adr + rd_ofs, self.buf_size - rd_ofs)
+    return x + self.cpu.rdbytes(self.buf_adr, wr_ofs)
 
   def poll(self, ui):
     """poll this buffer"""
-    wr_ofs = self.cpu.rd(self.wr_ofs_adr, 32)
-    rd_ofs = self.cpu.rd(self.rd_ofs_adr, 32)
+    (wr_ofs, rd_ofs) = self.get_ofs()
 
     ui.put('wr ofs 0x%x\n' % wr_ofs)
     ui.put('rd ofs 0x%x\n' % rd_ofs)
 
     if wr_ofs != rd_ofs:
       buf = iobuf.data_buffer(8)
-      if rd_ofs < wr_ofs:
-        # read to write offset
-        self.cpu.rdmem(self.buf_adr + rd_ofs, wr_ofs - rd_ofs, buf)
-      else:
-        # read to end of buffer
-        self.cpu.rdmem(self.buf_adr + rd_ofs, self.buf_size - rd_ofs, buf)
-        # read to write offset
-        self.cpu.rdmem(self.buf_adr, wr_ofs, buf)
+      buf.from_bytes(self.rd_data(rd_ofs, wr_ofs), 'le')
       self.cpu.wr(self.rd_ofs_adr, wr_ofs, 32)
       ui.put('%d bytes read\n' % len(buf))
       ui.put('%s\n' % buf.ascii_str())
@@ -78,21 +98,12 @@ class rtt_buf(object):
 
   def read(self):
     """read the buffer"""
-    wr_ofs = self.cpu.rd(self.wr_ofs_adr, 32)
-    rd_ofs = self.cpu.rd(self.rd_ofs_adr, 32)
+    (wr_ofs, rd_ofs) = self.get_ofs()
     # do we have data?
     if wr_ofs != rd_ofs:
       # we have data - read it
-      # TODO: possible performance improvement with 32 bit reads
       buf = iobuf.data_buffer(8)
-      if rd_ofs < wr_ofs:
-        # non-wrapped buffer: read to write offset
-        self.cpu.rdmem(self.buf_adr + rd_ofs, wr_ofs - rd_ofs, buf)
-      else:
-        # wrapped buffer: read to end of buffer
-        self.cpu.rdmem(self.buf_adr + rd_ofs, self.buf_size - rd_ofs, buf)
-        # read to write offset
-        self.cpu.rdmem(self.buf_adr, wr_ofs, buf)
+      buf.from_bytes(self.rd_data(rd_ofs, wr_ofs), 'le')
       # we are caught up: read offset == write offset
       self.cpu.wr(self.rd_ofs_adr, wr_ofs, 32)
       return buf
@@ -188,20 +199,16 @@ class rtt(object):
       ui.put('did not find rtt signature\n')
       self.adr = None
       return
-    # starting address for rtt ring buffer structures
-    adr = self.adr + sizeof_SEGGER_RTT_CB_header
+    hdr = SEGGER_RTT_CB_header.rd(self.cpu, self.adr)
+    n_up = max(hdr.max_up, 0)
+    n_down = max(hdr.max_down, 0)
+    # read all of the rtt ring buffer structures
+    adr = self.adr + SEGGER_RTT_CB_header.size
+    bufs = SEGGER_RTT_RING_BUFFER.rd_array(self.cpu, adr, n_up + n_down)
     # target to host buffers
-    n = self.cpu.rd(self.adr + 16, 32)
-    self.t2h = []
-    for i in range(n):
-      self.t2h.append(rtt_buf(self.cpu, adr))
-      adr += sizeof_SEGGER_RTT_RING_BUFFER
+    self.t2h = [rtt_buf(self.cpu, x) for x in bufs[:n_up]]
     # host to target buffers
-    n = self.cpu.rd(self.adr + 20, 32)
-    self.h2t = []
-    for i in range(n):
-      self.h2t.append(rtt_buf(self.cpu, adr))
-      adr += sizeof_SEGGER_RTT_RING_BUFFER
+    self.h2t = [rtt_buf(self.cpu, x) for x in bufs[n_up:]]
     # remove any buffers with a size of 0
     self.t2h = [b for b in self.t2h if b.buf_size > 0]
     self.h2t = [b for b in self.h2t if b.buf_size > 0]
@@ -22,6 +22,11 @@ help_regs = (
   ('[name]', 'display registers for peripheral')
 )
 
+help_map = (
+  ('<cr>', 'display memory map'),
+  ('probe', 'find the readable memory (reads all peripheral registers)'),
+)
+
 # -----------------------------------------------------------------------------
 # utility functions
 
@@ -523,6 +528,8 @@ class device(object):
     self.series = None
     self.version = None
     self.cpu = None
+    # ram region usable for library routines (set by the vendor fixups)
+    self.rambuf = None
 
   def __getattr__(self, name):
     """make the peripheral name a class attribute"""
@@ -565,6 +572,13 @@ class device(object):
     # so tie break with the name to give a well-defined sort order
     return sorted(self.peripherals.values(), key=lambda x: (x.address << 16) + sum(bytearray(x.name.encode('utf8'))))
 
+  def lookup(self, adr):
+    """return the peripheral containing the address - or None"""
+    for p in self.peripheral_list():
+      if p.size is not None and p.address <= adr < p.address + p.size:
+        return p
+    return None
+
   def interrupt_list(self):
     """return an ordered interrupt list"""
     # sort by irq order
@@ -572,16 +586,31 @@ class device(object):
 
   def cmd_map(self, ui, args):
     """display memory map"""
+    if util.wrong_argc(ui, args, (0, 1)):
+      return
+    memmap = self.cpu.memmap
+    if len(args) == 1:
+      if args[0] != 'probe':
+        ui.put('bad argument: %s\n' % args[0])
+        return
+      memmap.probe(ui)
+      return
     clist = []
     for p in self.peripheral_list():
       start = p.address
       size = p.size
+      access = ''
       if size is None:
         region = ': %08x' % start
       else:
         region = ': %08x %08x %s' % (start, start + size - 1, util.memsize(size))
-      clist.append([p.name, region, p.description])
-    ui.put('%s\n' % util.display_cols(clist, [0, 0, 0]))
+        x = memmap.split(start, size)
+        if len(x) > 1:
+          access = 'part'
+        elif not x[0][2]:
+          access = 'none'
+      clist.append([p.name, region, access, p.description])
+    ui.put('%s\n' % util.display_cols(clist, [0, 0, 0, 0]))
 
   def cmd_regs(self, ui, args):
     """display peripheral registers"""
@@ -591,6 +620,9 @@ class device(object):
       ui.put("no peripheral named '%s' (run 'map' command for the names)\n" % args[0])
       return
     p = self.peripherals[args[0]]
+    if p.size and not self.cpu.memmap.is_readable(p.address, p.size):
+      ui.put('%s is not readable (see "map probe")\n' % p.name)
+      return
     if len(args) == 1:
       ui.put('%s\n' % p.display(fields=False))
       return
@@ -104,6 +104,10 @@ STLINK_DFU_EXIT = 0x07
 STLINK_SWIM_ENTER = 0x00
 STLINK_SWIM_EXIT = 0x01
 
+# last read/write status
+STLINK_DEBUG_ERR_OK = 0x80
+STLINK_DEBUG_ERR_FAULT = 0x81
+
 # api v1 core state
 STLINK_CORE_RUNNING = 0x80
 STLINK_CORE_HALTED = 0x81
@@ -326,6 +330,11 @@ class stlink:
     self.send_recv(cmd, 0)
     self.send_recv(buf, 0)
 
+  def get_last_rw_status(self):
+    """return the status of the last memory read/write"""
+    x = self.send_recv(Array('B', (STLINK_DEBUG_COMMAND, STLINK_DEBUG_APIV2_GETLASTRWSTATUS)), 2)
+    return x[0]
+
   def rd_mem8(self, adr, n):
     """read n 8-bit values from memory region"""
     # build the command
@@ -438,6 +447,20 @@ class dbgio:
       n -= nread
       adr += nread * 4
 
+  def probe_rd32(self, adr, n):
+    """read n 32-bit words from memory: return False if the read faults"""
+    ok = True
+    max_n = 0x5ff
+    while n > 0:
+      nread = (n, max_n)[n >= max_n]
+      self.stlink.rd_mem32(adr, nread)
+      # reading the status also clears it
+      if self.stlink.get_last_rw_status() != STLINK_DEBUG_ERR_OK:
+        ok = False
+      n -= nread
+      adr += nread * 4
+    return ok
+
   def rdmem16(self, adr, n, io):
     """read n 16-bit words from memory starting at adr"""
     # stlink does not have direct 16-bit read operations
@@ -0,0 +1,444 @@
+#-----------------------------------------------------------------------------
+"""
+
+Symbol Table
+
+Build an address to symbol/line index from the ELF symbol table and the
+DWARF line number program (.debug_line, versions 2 to 5). Lookups are a
+bisection of sorted address arrays. The parsed index is cached on disk,
+keyed by the hash of the ELF file, so a reload is fast.
+
+"""
+#-----------------------------------------------------------------------------
+
+import os
+import array
+import bisect
+import pickle
+import hashlib
+import struct
+
+import util
+import elf
+
+#-----------------------------------------------------------------------------
+
+help_symbols = (
+  ('<cr>', 'show the symbol table status'),
+  ('<file>', 'load symbols and line numbers from an ELF file'),
+  ('clear', 'remove the symbols'),
+)
+
+#-----------------------------------------------------------------------------
+
+_cache_version = 1
+
+STT_OBJECT = 1
+STT_FUNC = 2
+
+# DWARF line number program
+DW_LNS_copy = 1
+DW_LNS_advance_pc = 2
+DW_LNS_advance_line = 3
+DW_LNS_set_file = 4
+DW_LNS_const_add_pc = 8
+DW_LNS_fixed_advance_pc = 9
+DW_LNE_end_sequence = 1
+DW_LNE_set_address = 2
+DW_LNE_define_file = 3
+DW_LNCT_path = 1
+DW_LNCT_directory_index = 2
+
+# DWARF forms used in v5 line number headers
+DW_FORM_block = 0x09
+DW_FORM_data1 = 0x0b
+DW_FORM_data2 = 0x05
+DW_FORM_data4 = 0x06
+DW_FORM_data8 = 0x07
+DW_FORM_data16 = 0x1e
+DW_FORM_string = 0x08
+DW_FORM_strp = 0x0e
+DW_FORM_udata = 0x0f
+DW_FORM_line_strp = 0x1f
+
+_form_size = {
+  DW_FORM_data1: 1,
+  DW_FORM_data2: 2,
+  DW_FORM_data4: 4,
+  DW_FORM_data8: 8,
+  DW_FORM_data16: 16,
+}
+
+#-----------------------------------------------------------------------------
+
+class reader(object):
+  """read DWARF values from a bytes object"""
+
+  def __init__(self, data, ofs=0):
+    self.data = data
+    self.ofs = ofs
+
+  def u(self, n):
+    x = int.from_bytes(self.data[self.ofs:self.ofs + n], 'little')
+    self.ofs += n
+    return x
+
+  def s8(self):
+    x = self.u(1)
+    return x - ((x & 0x80) << 1)
+
+  def uleb(self):
+    x = shift = 0
+    while True:
+      b = self.data[self.ofs]
+      self.ofs += 1
+      x |= (b & 0x7f) << shift
+      shift += 7
+      if b & 0x80 == 0:
+        return x
+
+  def sleb(self):
+    x = shift = 0
+    while True:
+      b = self.data[self.ofs]
+      self.ofs += 1
+      x |= (b & 0x7f) << shift
+      shift += 7
+      if b & 0x80 == 0:
+        if b & 0x40:
+          x -= 1 << shift
+        return x
+
+  def cstr(self):
+    i = self.data.find(b'\0', self.ofs)
+    x = self.data[self.ofs:i].decode('latin-1')
+    self.ofs = i + 1
+    return x
+
+#-----------------------------------------------------------------------------
+
+def _cstr(data, ofs):
+  """return the null terminated string at data[ofs]"""
+  return data[ofs:data.find(b'\0', ofs)].decode('latin-1')
+
+def _join(d, name):
+  """join a directory and file name"""
+  if not d or name.startswith('/'):
+    return name
+  return '%s/%s' % (d, name)
+
+def _rd_form(r, form, strs):
+  """read a v5 line header attribute value"""
+  if form == DW_FORM_string:
+    return r.cstr()
+  if form == DW_FORM_strp:
+    return _cstr(strs[0], r.u(4))
+  if form == DW_FORM_line_strp:
+    return _cstr(strs[1], r.u(4))
+  if form == DW_FORM_udata:
+    return r.uleb()
+  if form == DW_FORM_block:
+    r.ofs += r.uleb()
+    return None
+  if form in _form_size:
+    return r.u(_form_size[form])
+  raise elf.Error('unsupported DWARF form 0x%x in .debug_line' % form)
+
+def _rd_entries(r, strs):
+  """read a v5 directory/file entry table: return [(path, directory index)]"""
+  fmt = [(r.uleb(), r.uleb()) for _ in range(r.u(1))]
+  entries = []
+  for _ in range(r.uleb()):
+    path = ''
+    dir_idx = 0
+    for (content, form) in fmt:
+      x = _rd_form(r, form, strs)
+      if content == DW_LNCT_path:
+        path = x
+      elif content == DW_LNCT_directory_index:
+        dir_idx = x
+    if not isinstance(path, str) or not isinstance(dir_idx, int):
+      raise elf.Error('bad DWARF file entry in .debug_line')
+    entries.append((path, dir_idx))
+  return entries
+
+def line_rows(data, strs):
+  """run the .debug_line programs: return [(address, file name or None, line)]"""
+  rows = []
+  ofs = 0
+  while ofs + 4 <= len(data):
+    r = reader(data, ofs)
+    unit_length = r.u(4)
+    if unit_length >= 0xfffffff0:
+      raise elf.Error('64-bit DWARF is not supported')
+    end = r.ofs + unit_length
+    ofs = end
+    version = r.u(2)
+    if version not in (2, 3, 4, 5):
+      continue
+    if version == 5:
+      # address size, segment selector size
+      r.u(2)
+    header_length = r.u(4)
+    program = r.ofs + header_length
+    min_inst = r.u(1)
+    if version >= 4:
+      # maximum operations per instruction
+      r.u(1)
+    # default is_stmt
+    r.u(1)
+    line_base = r.s8()
+    line_range = r.u(1)
+    opcode_base = r.u(1)
+    if line_range == 0:
+      raise elf.Error('bad DWARF line range in .debug_line')
+    opcode_lengths = [0,] + [r.u(1) for _ in range(opcode_base - 1)]
+    if version == 5:
+      dirs = [x[0] for x in _rd_entries(r, strs)]
+      files = [_join(dirs[d] if d < len(dirs) else '', f) for (f, d) in _rd_entries(r, strs)]
+    else:
+      dirs = ['',]
+      while data[r.ofs] != 0:
+        dirs.append(r.cstr())
+      r.ofs += 1
+      # file numbers start at 1
+      files = [None,]
+      while data[r.ofs] != 0:
+        f = r.cstr()
+        d = r.uleb()
+        r.uleb()
+        r.uleb()
+        files.append(_join(dirs[d] if d < len(dirs) else '', f))
+      r.ofs += 1
+    # run the line number program
+    r.ofs = program
+    adr = 0
+    fidx = 1
+    line = 1
+    while r.ofs < end:
+      op = r.u(1)
+      if op >= opcode_base:
+        # special opcode
+        op -= opcode_base
+        adr += (op // line_range) * min_inst
+        line += line_base + (op % line_range)
+        rows.append((adr, fidx, line, files))
+      elif op == 0:
+        # extended opcode
+        n = r.uleb()
+        next_ofs = r.ofs + n
+        sub = r.u(1)
+        if sub == DW_LNE_end_sequence:
+          rows.append((adr, None, 0, files))
+          adr = 0
+          fidx = 1
+          line = 1
+        elif sub == DW_LNE_set_address:
+          adr = r.u(n - 1)
+        elif sub == DW_LNE_define_file:
+          f = r.cstr()
+          d = r.uleb()
+          files.append(_join(dirs[d] if d < len(dirs) else '', f))
+        r.ofs = next_ofs
+      elif op == DW_LNS_copy:
+        rows.append((adr, fidx, line, files))
+      elif op == DW_LNS_advance_pc:
+        adr += r.uleb() * min_inst
+      elif op == DW_LNS_advance_line:
+        line += r.sleb()
+      elif op == DW_LNS_set_file:
+        fidx = r.uleb()
+      elif op == DW_LNS_const_add_pc:
+        adr += ((255 - opcode_base) // line_range) * min_inst
+      elif op == DW_LNS_fixed_advance_pc:
+        adr += r.u(2)
+      else:
+        # skip the arguments of other standard opcodes
+        for _ in range(opcode_lengths[op]):
+          r.uleb()
+  # resolve the file names
+  out = []
+  for (adr, fidx, line, files) in rows:
+    name = None
+    if fidx is not None and fidx < len(files):
+      name = files[fidx]
+    out.append((adr, name, line))
+  return out
+
+#-----------------------------------------------------------------------------
+
+class symbols(object):
+  """address to symbol and line number index"""
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.name = None
+    # symbols: sorted addresses, sizes, names
+    self.sym_adr = array.array('L')
+    self.sym_size = array.array('L')
+    self.sym_name = []
+    # name -> symbol index, built on first use
+    self.by_name = None
+    # lines: sorted addresses, file indices, line numbers, file names
+    self.line_adr = array.array('L')
+    self.line_file = array.array('H')
+    self.line_num = array.array('L')
+    self.files = []
+
+  def build_symbols(self, x):
+    """build the symbol index from the ELF symbol table"""
+    symtab = x.section('.symtab')
+    if symtab is None or symtab.link >= len(x.sections):
+      return
+    strtab = x.sections[symtab.link].data
+    syms = []
+    for ofs in range(0, len(symtab.data) - 15, 16):
+      (name, value, size, info, _, shndx) = struct.unpack_from('<LLLBBH', symtab.data, ofs)
+      stype = info & 15
+      if stype not in (STT_FUNC, STT_OBJECT) or shndx == 0:
+        continue
+      name = _cstr(strtab, name)
+      if not name or name.startswith('$'):
+        continue
+      if stype == STT_FUNC:
+        # remove the thumb bit
+        value &= ~1
+      # prefer functions and global symbols at the same address
+      syms.append((value, stype != STT_FUNC, (info >> 4) == 0, size, name))
+    syms.sort()
+    for s in syms:
+      if self.sym_adr and self.sym_adr[-1] == s[0]:
+        continue
+      self.sym_adr.append(s[0])
+      self.sym_size.append(s[3])
+      self.sym_name.append(s[4])
+
+  def build_lines(self, x):
+    """build the line number index from the DWARF line number programs"""
+    debug_line = x.section('.debug_line')
+    if debug_line is None:
+      return
+    strs = []
+    for name in ('.debug_str', '.debug_line_str'):
+      s = x.section(name)
+      strs.append(b'' if s is None else s.data)
+    rows = line_rows(debug_line.data, strs)
+    # sort by address, end of sequence rows first
+    rows.sort(key=lambda r: (r[0], r[1] is not None))
+    files = {}
+    prev = None
+    for (adr, name, line) in rows:
+      if name is None:
+        fidx = 0xffff
+      else:
+        if name not in files:
+          files[name] = len(self.files)
+          self.files.append(name)
+        fidx = files[name]
+      # only keep rows that change the file/line
+      if prev == (fidx, line):
+        continue
+      if self.line_adr and self.line_adr[-1] == adr:
+        self.line_file[-1] = fidx
+        self.line_num[-1] = line
+      else:
+        self.line_adr.append(adr)
+        self.line_file.append(fidx)
+        self.line_num.append(line)
+      prev = (fidx, line)
+
+  def load(self, name):
+    """load the symbols from an ELF file: return True if the cache was used"""
+    with open(name, 'rb') as f:
+      h = hashlib.sha1(f.read()).hexdigest()
+    cname = util.cache_file('sym_%s.pickle' % h)
+    try:
+      with open(cname, 'rb') as f:
+        x = pickle.load(f)
+      if x[0] == _cache_version:
+        self.clear()
+        (_, self.sym_adr, self.sym_size, self.sym_name, self.line_adr, self.line_file, self.line_num, self.files) = x
+        self.name = name
+        return True
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, ValueError):
+      pass
+    x = elf.elf(name)
+    self.clear()
+    try:
+      self.build_symbols(x)
+      self.build_lines(x)
+    except elf.Error as e:
+      self.clear()
+      raise elf.Error('%s: %s' % (name, e))
+    except (IndexError, ValueError, OverflowError, struct.error) as e:
+      # malformed debug information
+      self.clear()
+      raise elf.Error('%s: bad symbol/line information (%s)' % (name, e))
+    self.name = name
+    x = (_cache_version, self.sym_adr, self.sym_size, self.sym_name, self.line_adr, self.line_file, self.line_num, self.files)
+    with open(cname, 'wb') as f:
+      pickle.dump(x, f, pickle.HIGHEST_PROTOCOL)
+    return False
+
+  def lookup(self, adr):
+    """return the (symbol name, offset) for an address - or None"""
+    i = bisect.bisect_right(self.sym_adr, adr) - 1
+    if i < 0:
+      return None
+    ofs = adr - self.sym_adr[i]
+    size = self.sym_size[i]
+    if size and ofs >= size:
+      return None
+    return (self.sym_name[i], ofs)
+
+  def find(self, name):
+    """return the (address, size) of a named symbol - or None"""
+    if self.by_name is None:
+      self.by_name = dict([(x, i) for (i, x) in enumerate(self.sym_name)])
+    i = self.by_name.get(name)
+    if i is None:
+      return None
+    return (self.sym_adr[i], self.sym_size[i])
+
+  def line(self, adr):
+    """return the (file name, line number) for an address - or None"""
+    i = bisect.bisect_right(self.line_adr, adr) - 1
+    if i < 0 or self.line_file[i] == 0xffff:
+      return None
+    return (self.files[self.line_file[i]], self.line_num[i])
+
+  def annotate(self, adr):
+    """return a symbol+offset file:line string for an address - or ''"""
+    s = []
+    x = self.lookup(adr)
+    if x is not None:
+      s.append(('%s+0x%x' % x, x[0])[x[1] == 0])
+    x = self.line(adr)
+    if x is not None:
+      s.append('%s:%d' % (os.path.basename(x[0]), x[1]))
+    return ' '.join(s)
+
+  def cmd_symbols(self, ui, args):
+    """load/show the symbol table"""
+    if util.wrong_argc(ui, args, (0, 1)):
+      return
+    if len(args) == 1:
+      if args[0] == 'clear':
+        self.clear()
+        return
+      try:
+        cached = self.load(args[0])
+      except (IOError, OSError, elf.Error) as e:
+        ui.put('%s\n' % e)
+        return
+      ui.put('%s loaded%s\n' % (args[0], ('', ' (cached)')[cached]))
+    ui.put('%s\n' % self)
+
+  def __str__(self):
+    if self.name is None:
+      return 'no symbols loaded'
+    return '%s: %d symbols, %d line entries, %d files' % (self.name, len(self.sym_adr), len(self.line_adr), len(self.files))
+
+#-----------------------------------------------------------------------------
@@ -15,6 +15,10 @@ SDRAM: AS4C4M16SA-7BCN (4Mx16bit SDRAM)
 import cli
 import cortexm
 import mem
+import coredump
+import loader
+import variables
+import freertos
 import soc
 import flash
 import gpio
@@ -179,6 +183,10 @@ class target(object):
     self.cpu = cortexm.cortexm(self, ui, self.dbgio, self.device)
     self.device.bind_cpu(self.cpu)
     self.mem = mem.mem(self.cpu)
+    self.coredump = coredump.coredump(self.cpu)
+    self.loader = loader.loader(self.cpu)
+    self.vars = variables.variables(self.cpu)
+    self.rtos = freertos.freertos(self.cpu)
     self.flash = flash.flash(flash_driver.sdrv(self.device), self.device, self.mem)
     gpio_drv = (gpio_driver.drv(self.device, gpio_cfg))
     self.gpio = gpio.gpio(gpio_drv)
@@ -191,6 +199,7 @@ class target(object):
 
     self.menu_root = (
       ('codec', self.codec.menu, 'codec functions'),
+      ('coredump', self.coredump.cmd_coredump, coredump.help_coredump),
       ('cpu', self.cpu.menu, 'cpu functions'),
       ('da', self.cpu.cmd_disassemble, cortexm.help_disassemble),
       ('debugger', self.dbgio.menu, 'debugger functions'),
@@ -203,11 +212,14 @@ class target(object):
       ('history', self.ui.cmd_history, cli.history_help),
       ('i2c1', self.i2c1.menu, 'i2c1 functions'),
       ('i2c3', self.i2c3.menu, 'i2c3 functions'),
-      ('map', self.device.cmd_map),
+      ('load', self.loader.cmd_load, loader.help_load),
+      ('map', self.device.cmd_map, soc.help_map),
       ('mem', self.mem.menu, 'memory functions'),
       ('program', self.flash.cmd_program, flash.help_program),
       ('regs', self.cmd_regs, soc.help_regs),
+      ('rtos', self.rtos.menu, 'rtos functions'),
       ('rtt', self.rtt.menu, 'rtt client functions'),
+      ('vars', self.vars.menu, 'live variable functions'),
       ('vtable', self.cpu.cmd_vtable),
     )
 
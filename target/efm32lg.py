@@ -9,6 +9,10 @@ EFM32 Leopard Gecko Starter Kit (EFM32LG990F256)
 import cli
 import cortexm
 import mem
+import coredump
+import loader
+import variables
+import freertos
 import soc
 import flash
 import gpio
@@ -152,6 +156,10 @@ class target(object):
     self.cpu = cortexm.cortexm(self, ui, self.dbgio, self.device)
     self.device.bind_cpu(self.cpu)
     self.mem = mem.mem(self.cpu)
+    self.coredump = coredump.coredump(self.cpu)
+    self.loader = loader.loader(self.cpu)
+    self.vars = variables.variables(self.cpu)
+    self.rtos = freertos.freertos(self.cpu)
     #self.flash = flash.flash(flash_driver.flash(self.device), self.device, self.mem)
     gpio_drv = (gpio_driver.drv(self.device, gpio_cfg))
     self.gpio = gpio.gpio(gpio_drv)
@@ -161,6 +169,7 @@ class target(object):
     self.rtt = rtt.rtt(self.cpu, mem.region('ram', ram.address, ram.size))
 
     self.menu_root = (
+      ('coredump', self.coredump.cmd_coredump, coredump.help_coredump),
       ('cpu', self.cpu.menu, 'cpu functions'),
       ('da', self.cpu.cmd_disassemble, cortexm.help_disassemble),
       ('debugger', self.dbgio.menu, 'debugger functions'),
@@ -172,11 +181,14 @@ class target(object):
       ('help', self.ui.cmd_help),
       ('history', self.ui.cmd_history, cli.history_help),
       #('i2c', self.i2c.menu, 'i2c functions'),
-      ('map', self.device.cmd_map),
+      ('load', self.loader.cmd_load, loader.help_load),
+      ('map', self.device.cmd_map, soc.help_map),
       ('mem', self.mem.menu, 'memory functions'),
       #('program', self.flash.cmd_program, flash.help_program),
       ('regs', self.cmd_regs, soc.help_regs),
+      ('rtos', self.rtos.menu, 'rtos functions'),
       ('rtt', self.rtt.menu, 'rtt client functions'),
+      ('vars', self.vars.menu, 'live variable functions'),
       ('vtable', self.cpu.cmd_vtable),
     )
 
@@ -11,6 +11,10 @@ NXP development board for Kinetis Chips
 import cli
 import cortexm
 import mem
+import coredump
+import loader
+import variables
+import freertos
 import soc
 import vendor.nxp.kinetis as kinetis
 
@@ -42,8 +46,13 @@ class target(object):
     self.cpu = cortexm.cortexm(self, ui, self.dbgio, self.device)
     self.device.bind_cpu(self.cpu)
     self.mem = mem.mem(self.cpu)
+    self.coredump = coredump.coredump(self.cpu)
+    self.loader = loader.loader(self.cpu)
+    self.vars = variables.variables(self.cpu)
+    self.rtos = freertos.freertos(self.cpu)
 
     self.menu_root = (
+      ('coredump', self.coredump.cmd_coredump, coredump.help_coredump),
       ('cpu', self.cpu.menu, 'cpu functions'),
       ('da', self.cpu.cmd_disassemble, cortexm.help_disassemble),
       ('debugger', self.dbgio.menu, 'debugger functions'),
@@ -52,9 +61,12 @@ class target(object):
       ('halt', self.cpu.cmd_halt),
       ('help', self.ui.cmd_help),
       ('history', self.ui.cmd_history, cli.history_help),
-      ('map', self.device.cmd_map),
+      ('load', self.loader.cmd_load, loader.help_load),
+      ('map', self.device.cmd_map, soc.help_map),
       ('mem', self.mem.menu, 'memory functions'),
       ('regs', self.cmd_regs, soc.help_regs),
+      ('rtos', self.rtos.menu, 'rtos functions'),
+      ('vars', self.vars.menu, 'live variable functions'),
       ('vtable', self.cpu.cmd_vtable),
     )
 
@@ -9,6 +9,10 @@ Makerfabs Maduino Zero (ATSAMD21G18A)
 import cli
 import cortexm
 import mem
+import coredump
+import loader
+import variables
+import freertos
 import soc
 import flash
 
@@ -43,9 +47,14 @@ class target(object):
     self.cpu = cortexm.cortexm(self, ui, self.dbgio, self.device)
     self.device.bind_cpu(self.cpu)
     self.mem = mem.mem(self.cpu)
+    self.coredump = coredump.coredump(self.cpu)
+    self.loader = loader.loader(self.cpu)
+    self.vars = variables.variables(self.cpu)
+    self.rtos = freertos.freertos(self.cpu)
     self.flash = flash.flash(flash_driver.flash(self.device), self.device, self.mem)
 
     self.menu_root = (
+      ('coredump', self.coredump.cmd_coredump, coredump.help_coredump),
       ('cpu', self.cpu.menu, 'cpu functions'),
       ('da', self.cpu.cmd_disassemble, cortexm.help_disassemble),
       ('debugger', self.dbgio.menu, 'debugger functions'),
@@ -55,10 +64,13 @@ class target(object):
       ('halt', self.cpu.cmd_halt),
       ('help', self.ui.cmd_help),
       ('history', self.ui.cmd_history, cli.history_help),
-      ('map', self.device.cmd_map),
+      ('load', self.loader.cmd_load, loader.help_load),
+      ('map', self.device.cmd_map, soc.help_map),
       ('mem', self.mem.menu, 'memory functions'),
       ('program', self.flash.cmd_program, flash.help_program),
       ('regs', self.cmd_regs, soc.help_regs),
+      ('rtos', self.rtos.menu, 'rtos functions'),
+      ('vars', self.vars.menu, 'live variable functions'),
       ('vtable', self.cpu.cmd_vtable),
     )
 
@@ -102,6 +102,15 @@ def file_arg(ui, name):
 
 # ----------------------------------------------------------------------------
 
+def cache_file(name):
+  """return the path of a file in the pycs cache directory"""
+  path = os.path.join(os.path.expanduser('~'), '.cache', 'pycs')
+  if not os.path.isdir(path):
+    os.makedirs(path)
+  return os.path.join(path, name)
+
+# ----------------------------------------------------------------------------
+
 def sex_arg(ui, arg, width):
   """sign extend a 32 bit argument to 64 bits"""
   limits = (limit_32, limit_64)[width == 64]
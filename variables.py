@@ -0,0 +1,239 @@
+#-----------------------------------------------------------------------------
+"""
+
+Live Variables
+
+Sample global variables (found by name in the symbol table) while the
+target runs. Nearby variables are grouped so each sample takes a minimal
+number of contiguous reads. Samples are kept in array backed ring buffers
+and can be streamed to a CSV file.
+
+"""
+#-----------------------------------------------------------------------------
+
+import array
+import time
+import csv
+
+import util
+import cstruct
+
+#-----------------------------------------------------------------------------
+
+help_watch = (
+  ('<sym>[:type] ... [--rate hz] [--n samples] [--csv file]', 'sample variables while the target runs'),
+  ('  sym', 'global variable name (see "cpu symbols")'),
+  ('  type', 'u8 i8 u16 i16 u32 i32 u64 i64 f32 f64 (default: unsigned of the symbol size)'),
+  ('  --rate', 'samples per second, 0 = as fast as possible (default 100)'),
+  ('  --n', 'number of samples (default: until Ctrl-D)'),
+  ('  --csv', 'write the samples to a CSV file'),
+)
+
+#-----------------------------------------------------------------------------
+
+# variables closer than this are read together
+_gap_max = 64
+
+# samples held in the ring buffers
+_ring_size = 4096
+
+# display interval (secs)
+_display_interval = 0.5
+
+_default_types = {1: 'u8', 2: 'u16', 4: 'u32', 8: 'u64'}
+_types = ('u8', 'i8', 'u16', 'i16', 'u32', 'i32', 'u64', 'i64', 'f32', 'f64')
+
+#-----------------------------------------------------------------------------
+
+class ring(object):
+  """array backed ring buffer of samples"""
+
+  def __init__(self, n):
+    self.n = n
+    self.buf = array.array('d', bytes(8 * n))
+    self.idx = 0
+    self.count = 0
+
+  def add(self, x):
+    self.buf[self.idx] = x
+    self.idx = (self.idx + 1) % self.n
+    self.count += 1
+
+  def last(self):
+    """return the most recent sample"""
+    return self.buf[(self.idx - 1) % self.n]
+
+  def samples(self):
+    """return the buffered samples, oldest first"""
+    if self.count < self.n:
+      return self.buf[:self.idx]
+    return self.buf[self.idx:] + self.buf[:self.idx]
+
+#-----------------------------------------------------------------------------
+
+class group(object):
+  """variables read with a single contiguous read"""
+
+  def __init__(self, v):
+    self.adr = util.align(v[1], 32)
+    self.end = v[1] + v[2]
+    self.vars = [v]
+
+  def add(self, v):
+    """add a variable if it is close enough: return True if added"""
+    if v[1] - self.end > _gap_max:
+      return False
+    self.end = max(self.end, v[1] + v[2])
+    self.vars.append(v)
+    return True
+
+  def finish(self):
+    """build the layout for the group"""
+    self.size = util.roundup(self.end - self.adr, 32)
+    self.layout = cstruct.layout('group', [(name, adr - self.adr, vtype) for (name, adr, _, vtype) in self.vars], self.size)
+
+#-----------------------------------------------------------------------------
+
+class variables(object):
+
+  def __init__(self, cpu):
+    self.cpu = cpu
+    self.symbols = cpu.symbols
+    # the most recent samples
+    self.names = []
+    self.rings = []
+    self.times = None
+    self.menu = (
+      ('watch', self.cmd_watch, help_watch),
+    )
+
+  def parse_vars(self, ui, args):
+    """return a list of (name, adr, size, type) - or None"""
+    vlist = []
+    for arg in args:
+      (name, _, vtype) = arg.partition(':')
+      if name in [v[0] for v in vlist]:
+        ui.put('%s: repeated variable\n' % name)
+        return None
+      x = self.symbols.find(name)
+      if x is None:
+        ui.put('unknown symbol %s\n' % name)
+        return None
+      (adr, size) = x
+      if not vtype:
+        vtype = _default_types.get(size)
+        if vtype is None:
+          ui.put('%s: size %d, specify a type\n' % (name, size))
+          return None
+      if vtype.lstrip('<>') not in _types:
+        ui.put('%s: bad type %s\n' % (name, vtype))
+        return None
+      size = cstruct.layout(name, ((name, 0, vtype),)).size
+      vlist.append((name, adr, size, vtype))
+    return vlist
+
+  def parse_opts(self, ui, args):
+    """return the (variable args, rate, n, csv name) - or None"""
+    opts = {'--rate': '100', '--n': None, '--csv': None}
+    vargs = []
+    i = 0
+    while i < len(args):
+      if args[i] in opts:
+        if i + 1 == len(args):
+          ui.put('%s needs a value\n' % args[i])
+          return None
+        opts[args[i]] = args[i + 1]
+        i += 2
+      else:
+        vargs.append(args[i])
+        i += 1
+    rate = util.int_arg(ui, opts['--rate'], (0, 100000), 10)
+    if rate is None:
+      return None
+    n = None
+    if opts['--n'] is not None:
+      n = util.int_arg(ui, opts['--n'], (1, 1 << 30), 10)
+      if n is None:
+        return None
+    return (vargs, rate, n, opts['--csv'])
+
+  def groups(self, vlist):
+    """group nearby variables for contiguous reads"""
+    groups = []
+    for v in sorted(vlist, key=lambda x: x[1]):
+      if not groups or not groups[-1].add(v):
+        groups.append(group(v))
+    for g in groups:
+      g.finish()
+    return groups
+
+  def cmd_watch(self, ui, args):
+    """sample variables while the target runs"""
+    if self.symbols.name is None:
+      ui.put('no symbols loaded (see "cpu symbols")\n')
+      return
+    x = self.parse_opts(ui, args)
+    if x is None:
+      return
+    (vargs, rate, n, csv_name) = x
+    if not vargs:
+      ui.put('no variables\n')
+      return
+    vlist = self.parse_vars(ui, vargs)
+    if vlist is None:
+      return
+    groups = self.groups(vlist)
+    self.names = [v[0] for v in vlist]
+    self.rings = [ring(_ring_size) for _ in vlist]
+    self.times = ring(_ring_size)
+    ring_idx = dict([(name, i) for (i, name) in enumerate(self.names)])
+    f = writer = None
+    if csv_name is not None:
+      try:
+        f = open(csv_name, 'w', newline='')
+      except (IOError, OSError) as e:
+        ui.put('%s\n' % e)
+        return
+      writer = csv.writer(f)
+      writer.writerow(['time',] + self.names)
+    ui.put('%d variables, %d reads per sample\n' % (len(vlist), len(groups)))
+    period = 1.0 / rate if rate else 0.0
+    state = {'n': 0}
+    t_start = time.time()
+
+    def sample():
+      """take samples until the next display time"""
+      t_display = time.time() + _display_interval
+      while True:
+        t = time.time()
+        vals = [None,] * len(vlist)
+        for g in groups:
+          r = g.layout.unpack(self.cpu.rdbytes(g.adr, g.size))
+          for (name, _, _, _) in g.vars:
+            vals[ring_idx[name]] = getattr(r, name)
+        t -= t_start
+        self.times.add(t)
+        for (x, val) in zip(self.rings, vals):
+          x.add(val)
+        if writer is not None:
+          writer.writerow(['%.6f' % t,] + vals)
+        state['n'] += 1
+        if n is not None and state['n'] >= n:
+          break
+        t_next = t_start + (state['n'] * period)
+        if time.time() >= t_display or t_next >= t_display:
+          break
+        delay = t_next - time.time()
+        if delay > 0:
+          time.sleep(delay)
+      ui.put('%s\n' % ' '.join(['%s=%g' % (name, x.last()) for (name, x) in zip(self.names, self.rings)]))
+      return n is not None and state['n'] >= n
+
+    ui.put('Ctrl-D to exit\n')
+    ui.cli.ln.loop(sample)
+    t = time.time() - t_start
+    if f is not None:
+      f.close()
+    ui.put('%d samples in %.2f secs, %.1f samples/sec per variable\n' % (state['n'], t, float(state['n']) / t))
+
+#-----------------------------------------------------------------------------